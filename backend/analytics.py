@@ -0,0 +1,163 @@
+import csv
+import enum
+import io
+import threading
+from datetime import date
+
+import numpy as np
+
+from outing import Approval, Outing
+from storage import OUTING_COLUMNS
+
+# Columns reports can group outings by, and the Outing attribute behind each
+GROUP_COLUMNS = {"HostelName": "hostel_name", "Batch": "batch", "Course": "course"}
+
+
+def _days(values):
+    # datetime64[D] array; NaT where the sheet holds no valid date
+    return np.array([value if isinstance(value, date) else None for value in values], dtype="datetime64[D]")
+
+
+def _text(values):
+    return np.array([value.value if isinstance(value, enum.Enum) else str(value) for value in values], dtype=str)
+
+
+class OutingFrame:
+    """Outings as NumPy columns, one entry per outing in the same order.
+
+    ``outings`` keeps the parsed records for turning a selection back into
+    rows; ``archived`` marks outings read from the archive.
+    """
+
+    def __init__(self, outings, archived):
+        self.outings = outings
+        self.archived = np.full(len(outings), archived, dtype=bool)
+        self.out_date = _days([outing.out_date for outing in outings])
+        self.in_date = _days([outing.in_date for outing in outings])
+        self.out_approval = _text([outing.out_approval for outing in outings])
+        self.in_approval = _text([outing.in_approval for outing in outings])
+        self.out_time = _text([outing.out_time.strip() for outing in outings])
+        self.in_time = _text([outing.in_time.strip() for outing in outings])
+        self.groups = {column: _text([getattr(outing, field).strip() for outing in outings])
+                       for column, field in GROUP_COLUMNS.items()}
+
+    def __len__(self):
+        return len(self.outings)
+
+    @classmethod
+    def concat(cls, first, second):
+        frame = cls.__new__(cls)
+        frame.outings = first.outings + second.outings
+        for name in ("archived", "out_date", "in_date", "out_approval", "in_approval", "out_time", "in_time"):
+            setattr(frame, name, np.concatenate([getattr(first, name), getattr(second, name)]))
+        frame.groups = {column: np.concatenate([first.groups[column], second.groups[column]])
+                        for column in GROUP_COLUMNS}
+        return frame
+
+    def between(self, since=None, until=None):
+        """Boolean mask of outings whose OutDate is within ``[since, until]``."""
+        mask = ~np.isnat(self.out_date)
+        if since is not None:
+            mask &= self.out_date >= np.datetime64(since, "D")
+        if until is not None:
+            mask &= self.out_date <= np.datetime64(until, "D")
+        return mask
+
+
+def _counts(values, blank=""):
+    keys, counts = np.unique(values, return_counts=True)
+    return {str(key) or blank: int(count) for key, count in zip(keys, counts)}
+
+
+def overdue(frame, today):
+    """``(indices, days)`` of students still out after their InDate, longest overdue first.
+
+    A student is still out once the outing was approved and the gate
+    recorded an OutTime, until an InTime is recorded. All of these columns
+    are in ``storage.KEY_SPANS``, so a scan recorded by another process
+    shows up with the next reload.
+    """
+    today = np.datetime64(today, "D")
+    mask = ((frame.out_approval == Approval.APPROVED.value) & (frame.out_time != "")
+            & (frame.in_time == "") & (frame.in_date < today))
+    indices = np.flatnonzero(mask)
+    indices = indices[np.argsort(frame.in_date[indices], kind="stable")]
+    return indices, (today - frame.in_date[indices]).astype(int)
+
+
+def summary(frame, mask):
+    """Counts per group, per OutDate and per decision, and the average outing length."""
+    returned = mask & (frame.in_time != "") & ~np.isnat(frame.in_date)
+    lengths = (frame.in_date[returned] - frame.out_date[returned]).astype(int)
+    return {
+        "outings": int(mask.sum()),
+        "by": {column: _counts(values[mask]) for column, values in frame.groups.items()},
+        "perDay": _counts(frame.out_date[mask]),
+        "outApprovals": _counts(frame.out_approval[mask], blank="PENDING"),
+        "inApprovals": _counts(frame.in_approval[mask & ~np.isnat(frame.in_date)], blank="PENDING"),
+        "averageDaysOut": round(float(lengths.mean()), 2) if len(lengths) else None,
+    }
+
+
+def export_csv(frame, mask, chunk_size=500):
+    """Yield CSV text for the selected outings, oldest OutDate first, a chunk at a time."""
+    indices = np.flatnonzero(mask)
+    indices = indices[np.argsort(frame.out_date[indices], kind="stable")]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(OUTING_COLUMNS + ["Archived"])
+    for start in range(0, len(indices), chunk_size):
+        for idx in indices[start:start + chunk_size]:
+            record = frame.outings[idx].to_dict()
+            writer.writerow([record[column] for column in OUTING_COLUMNS] + [bool(frame.archived[idx])])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class Reports:
+    """Columnar copy of every outing, live and archived, for the report routes.
+
+    Registered as a storage listener; after any change the live columns
+    are rebuilt from the storage on the next report. Archived
+    outings are loaded once and reloaded only when ``archive.state()``
+    changes.
+    """
+
+    def __init__(self, storage, archive):
+        self.storage = storage
+        self.archive = archive
+        self._lock = threading.Lock()
+        self._changes = 0
+        self._live = None
+        self._live_changes = None
+        self._archived = None
+        self._archive_state = None
+        self._frame = None
+        storage.add_listener(self)
+
+    def reset(self, outings):
+        self._changes += 1
+
+    def row_changed(self, row_id, row):
+        self._changes += 1
+
+    def frame(self):
+        self.storage.refresh()
+        with self._lock:
+            state = self.archive.state()
+            if state != self._archive_state:
+                self._archived = OutingFrame([Outing.from_row(row) for row in self.archive.rows()], True)
+                self._archive_state = state
+                self._frame = None
+            changes = self._changes
+            if changes != self._live_changes:
+                # A change landing while this reads is picked up by the next call
+                self._live = OutingFrame([Outing.from_row(row) for _, row in self.storage.outings()], False)
+                self._live_changes = changes
+                self._frame = None
+            if self._frame is None:
+                self._frame = OutingFrame.concat(self._archived, self._live)
+            return self._frame
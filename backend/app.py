@@ -1,20 +1,74 @@
-from flask import Flask, request, jsonify
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from datetime import datetime
-from twilio.rest import Client
+from datetime import date, datetime
+from outbox import FakeSmsClient, SmsOutbox
+from storage import MirroredStorage, SheetsStorage, SqliteStorage
+from outing import Outing, serialize
+from search_index import OutingSearchIndex
+from archive import Archiver, OutingArchive, SharedLock, month_of
+from curfew import CurfewWatch
+from dashboard_query import DashboardQuery
+from dashboard_views import VIEWS, DashboardViews
+from gate_journal import GateJournal
+from app_logging import RowSampler, configure_logging, init_request_ids
+from metrics import REGISTRY, Collected, TracedSheets, count_rows, init_request_metrics, upstream_call
+from sheets_client import SheetsClientPool, SheetsGate, is_transient
+from student_directory import BoundedLRU
+from warmup import WarmUp
+import functools
+import hashlib
+import json
+import logging
 import os
+import uuid
+
+# LOG_LEVEL and LOG_FORMAT (json or text) pick what is logged and how.
+# Per-row diagnostics are DEBUG and only a LOG_ROW_SAMPLE_RATE fraction of
+# them is written, none by default.
+configure_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "json"))
+log = logging.getLogger("hostel")
+sample_row = RowSampler(log, float(os.getenv("LOG_ROW_SAMPLE_RATE", "0")))
 
 app = Flask(__name__)
-CORS(app)
+init_request_ids(app)
+init_request_metrics(app)
+# Let browser clients read the pagination cursor, ETag and request id of responses
+CORS(app, expose_headers=["X-Next-Cursor", "ETag", "X-Request-ID"])
 
 # Twilio credentials (it’s better to load these from environment variables)
 TWILIO_SID = os.getenv("TWILIO_SID", "AC05a85e2c43442877e98039e227a5f8f4")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "2ae69be51d821f93d5e532a7e5beae00")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER", "+12294719484")
 
-client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
+# SMS_BACKEND=fake records messages locally instead of calling Twilio
+SMS_BACKEND = os.getenv("SMS_BACKEND", "twilio")
+# The Twilio client is created when the first message is sent
+client = FakeSmsClient() if SMS_BACKEND == "fake" else None
+
+
+def sms_client():
+    global client
+    if client is None:
+        from twilio.rest import Client  # Imported here to keep start-up fast
+        client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
+    return client
+
+
+def send_sms(to, body):
+    with upstream_call("twilio", "messages.create"):
+        message = sms_client().messages.create(body=body, from_=TWILIO_PHONE_NUMBER, to=to)
+    return message.sid
+
+
+# Notifications are stored in a local outbox and sent by background workers,
+# so a slow or failing Twilio call never holds up an approval
+outbox = SmsOutbox(
+    os.getenv("SMS_OUTBOX_DB", "sms_outbox.sqlite3"),
+    send_sms,
+    workers=int(os.getenv("SMS_WORKERS", "2")),
+    max_attempts=int(os.getenv("SMS_MAX_ATTEMPTS", "5")),
+)
+outbox.start()
 
 
 # Google Sheets API setup
@@ -24,40 +78,279 @@ SERVICE_ACCOUNT_FILE = 'credentials.json'
 STUDENT_SHEET_ID = '1emmPzBdJrkWNIllVhRFc2ptqid9-GZySkaVMeVQBFgo' 
 WARDEN_SHEET_ID='1K-4kB8au_aDDHhdUAtjqZ5gKbiw8LZwadsniaEfu4tQ'
 
-credentials = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-service = build('sheets', 'v4', credentials=credentials)
-
-# Temporary storage for fetched student details
-fetched_students = {}
+# Seconds before a Sheets call times out; SHEETS_POOL_SIZE bounds how many
+# calls run in parallel
+SHEETS_TIMEOUT = float(os.getenv("SHEETS_TIMEOUT", "30"))
+SHEETS_POOL_SIZE = int(os.getenv("SHEETS_POOL_SIZE", "8"))
+
+# Credentials, the discovery document and the clients are all loaded on
+# first use, and the Google libraries imported then, so a worker starts
+# without touching the disk or the network
+
+
+@functools.lru_cache(maxsize=None)
+def sheets_credentials():
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+
+
+@functools.lru_cache(maxsize=None)
+def sheets_discovery_document():
+    # The Sheets v4 document bundled with google-api-python-client, parsed
+    # once for every pooled client instead of fetched from Google
+    from googleapiclient.discovery_cache import get_static_doc
+    return json.loads(get_static_doc('sheets', 'v4'))
+
+
+def build_sheets_client():
+    # httplib2 is not thread-safe, so every pooled client gets its own
+    # authorized connection
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+    http = AuthorizedHttp(sheets_credentials(), http=httplib2.Http(timeout=SHEETS_TIMEOUT))
+    return build_from_document(sheets_discovery_document(), http=http)
+
+
+sheets_pool = SheetsClientPool(build_sheets_client, size=SHEETS_POOL_SIZE)
+service = sheets_pool.client()
+
+# Seconds a downloaded copy of the warden sheet is served before refetching
+SHEET_CACHE_TTL = float(os.getenv("SHEET_CACHE_TTL", "15"))
+# Refetches only download the key columns and the rows that changed; every
+# SHEET_FULL_RELOAD_EVERY-th one downloads the whole sheet, so hand edits to
+# the student details of an outing (B:K) show up within
+# SHEET_FULL_RELOAD_EVERY * SHEET_CACHE_TTL seconds
+SHEET_FULL_RELOAD_EVERY = int(os.getenv("SHEET_FULL_RELOAD_EVERY", "8"))
+# Seconds between background refreshes of the in-memory student directory
+STUDENT_REFRESH_INTERVAL = float(os.getenv("STUDENT_REFRESH_INTERVAL", "300"))
+
+# STORAGE_BACKEND=sqlite serves everything from a local database; with
+# STORAGE_MIRROR=sheets its writes are also replayed onto the Google Sheets
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets")
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", "hostel.sqlite3")
+STORAGE_MIRROR = os.getenv("STORAGE_MIRROR", "")
+
+
+# Sheets quota per minute for the service account (0 turns the limit off);
+# identical concurrent reads are shared and 429/5xx answers are retried
+sheets_gate = SheetsGate(
+    reads_per_minute=int(os.getenv("SHEETS_READS_PER_MINUTE", "60")),
+    writes_per_minute=int(os.getenv("SHEETS_WRITES_PER_MINUTE", "60")),
+    burst=int(os.getenv("SHEETS_BURST", "10")),
+    max_wait=float(os.getenv("SHEETS_MAX_WAIT", "10")),
+    max_retries=int(os.getenv("SHEETS_MAX_RETRIES", "4")),
+)
+
+
+def sheets_service():
+    # Every Sheets call made through this is gated, and each attempt is
+    # timed for /metrics
+    return sheets_gate.wrap(TracedSheets(service))
+
+
+def build_storage():
+    sheets = SheetsStorage(sheets_service, WARDEN_SHEET_ID, STUDENT_SHEET_ID, cache_ttl=SHEET_CACHE_TTL,
+                           full_reload_every=SHEET_FULL_RELOAD_EVERY,
+                           student_refresh_interval=STUDENT_REFRESH_INTERVAL)
+    if STORAGE_BACKEND != "sqlite":
+        return sheets
+
+    local = SqliteStorage(STORAGE_SQLITE_PATH)
+    if local.is_empty() and os.getenv("STORAGE_SEED_FROM_SHEETS") == "1":
+        # First run: copy both sheets into the local database
+        students = sheets_service().spreadsheets().values().get(
+            spreadsheetId=STUDENT_SHEET_ID, range="Sheet1!A2:V").execute().get('values', [])
+        local.import_rows([row for _, row in sheets.outings()], students)
+    if STORAGE_MIRROR == "sheets":
+        return MirroredStorage(local, sheets, row_layout)
+    return local
+
+
+# Write requests hold this shared and the archiver exclusively, across all
+# worker processes sharing the ROW_LAYOUT_LOCK file (empty: this process only)
+row_layout = SharedLock(os.getenv("ROW_LAYOUT_LOCK", "row_layout.lock") or None)
+storage = build_storage()
+# Another process archived rows, so row numbers cached here are off
+row_layout.on_renumbered = storage.renumbered
+# Pending and approved requests per dashboard, updated as outings change
+views = DashboardViews(storage)
+# Guard search by name, room, hostel or FaceId, updated as outings change
+search_index = OutingSearchIndex(storage)
+
+# Closed outings are moved to a local archive every ARCHIVE_INTERVAL
+# seconds (0 turns this off) once they are ARCHIVE_MIN_AGE_DAYS old, so
+# the live sheet only holds open requests; /history still reaches them
+archive = OutingArchive(os.getenv("ARCHIVE_DB", "outing_archive.sqlite3"))
+archiver = Archiver(
+    storage, archive, row_layout,
+    min_age_days=int(os.getenv("ARCHIVE_MIN_AGE_DAYS", "7")),
+    interval=float(os.getenv("ARCHIVE_INTERVAL", "3600")),
+    batch_size=int(os.getenv("ARCHIVE_BATCH_SIZE", "500")),
+)
+archiver.start()
+
+# Guard scans are written to a local journal and acknowledged at once; a
+# background replicator pushes them to the storage in order, so a student
+# never waits at the gate on a Sheets call
+gate_journal = GateJournal(
+    os.getenv("GATE_JOURNAL_DB", "gate_journal.sqlite3"), storage, row_layout,
+    batch_size=int(os.getenv("GATE_JOURNAL_BATCH_SIZE", "100")),
+)
+gate_journal.start()
+
+# Wardens at CURFEW_ALERT_NUMBERS (comma-separated; none means the alert is
+# only logged) get one SMS listing students not back by CURFEW_TIME on their
+# InDate, as soon as the deadline passes
+CURFEW_ALERT_NUMBERS = [number.strip() for number in os.getenv("CURFEW_ALERT_NUMBERS", "").split(",")
+                        if number.strip()]
+# Students named in one alert; the rest are counted
+CURFEW_ALERT_MAX_LISTED = 20
+
+
+def curfew_alert(outings):
+    listed = [f"{outing.name} ({outing.student_id}), {outing.hostel_name} {outing.room_no}"
+              for outing in outings[:CURFEW_ALERT_MAX_LISTED]]
+    more = len(outings) - len(listed)
+    body = f"{len(outings)} student(s) not back by curfew: " + "; ".join(listed) + (f"; and {more} more" if more else "")
+    # Queued like every other SMS; the outbox workers send it via Twilio
+    outbox.enqueue_many([(number, body) for number in CURFEW_ALERT_NUMBERS])
+
+
+curfew_watch = CurfewWatch(
+    storage, os.getenv("CURFEW_DB", "curfew_alerts.sqlite3"), curfew_alert,
+    curfew=datetime.strptime(os.getenv("CURFEW_TIME", "21:00"), "%H:%M").time(),
+    refresh_interval=float(os.getenv("CURFEW_REFRESH_INTERVAL", "300")),
+)
+curfew_watch.start()
+
+# Caches are filled in the background; /readyz answers 503 until they are
+USES_SHEETS = STORAGE_BACKEND != "sqlite" or STORAGE_MIRROR == "sheets"
+warm_up = WarmUp(
+    ([("sheets_client", sheets_pool.warm)] if USES_SHEETS else [])
+    + [("storage", storage.start), ("dashboards", lambda: [views.version(name) for name in VIEWS])],
+    retry_interval=float(os.getenv("WARM_UP_RETRY_INTERVAL", "5")),
+)
+warm_up.start()
+
+
+@app.before_request
+def ensure_warm_up():
+    # Starts the warm-up, the SMS workers, the archiver, the gate replicator
+    # and the curfew watch in workers forked after import (gunicorn --preload)
+    warm_up.start()
+    outbox.start()
+    archiver.start()
+    gate_journal.start()
+    curfew_watch.start()
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    ready, checks = warm_up.status()
+    return jsonify({"ready": ready, "checks": checks}), 200 if ready else 503
+
+
+def holds_row_layout(view):
+    # For routes that look a row up by number and then write to it;
+    # archiving deletes rows and renumbers the rest, so it waits for them to
+    # finish. Read-only routes and the journaled gate scans (replicated
+    # under the lock) never wait on an archive pass and its Sheets calls.
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        row_layout.acquire_shared()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            row_layout.release_shared()
+    return wrapper
+
+
+# Seconds clients are told to wait when Google is throttling us or failing
+UPSTREAM_RETRY_AFTER = int(os.getenv("UPSTREAM_RETRY_AFTER", "5"))
+
+
+def failure_response(error, message=None):
+    # Quota and Google outages pass, so tell the client when to try again
+    # rather than reporting a server error
+    if is_transient(error):
+        return (jsonify({"error": "Google Sheets is busy, please try again shortly."}), 503,
+                {"Retry-After": str(UPSTREAM_RETRY_AFTER)})
+    return jsonify({"error": message or str(error)}), 500
+
+# One per process, made on first use: view versions count from zero in each
+# worker (including those forked with --preload) and after every restart, so
+# an ETag from another worker or an earlier run must never match
+_views_epochs = {}
+
+
+def views_epoch():
+    pid = os.getpid()
+    epoch = _views_epochs.get(pid)
+    if epoch is None:
+        epoch = _views_epochs.setdefault(pid, uuid.uuid4().hex[:8])
+    return epoch
+
+# Seconds between keep-alive comments on an idle event stream
+EVENT_STREAM_KEEPALIVE = float(os.getenv("EVENT_STREAM_KEEPALIVE", "15"))
+
+
+def dashboard_etag(view, version):
+    # The view's version plus the query string, which selects page and fields
+    query = hashlib.sha1(request.query_string).hexdigest()[:12]
+    return f"{view}-{views_epoch()}-{version}-{query}"
+
+
+def not_modified(etag):
+    if not request.if_none_match.contains(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def dashboard_response(query, records, next_cursor, etag):
+    # Apply the fields= projection; the next page's cursor goes in a header
+    # so the body stays the plain list clients already parse
+    response = jsonify(query.project(records))
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    # Clients revalidate every poll; unchanged views answer 304
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response, 200
+
+
+# Details of recently fetched students, as (sheet row, response body)
+fetched_students = BoundedLRU(int(os.getenv("FETCHED_STUDENTS_MAX", "1024")))
 
 # Route to fetch student details from the existing Google Sheet
 @app.route('/fetch_student', methods=['POST'])
 def fetch_student():
     try:
         student_id = request.json.get('StudentId')
-        result = service.spreadsheets().values().get(
-            spreadsheetId=STUDENT_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
-        for row in rows:
-            if row[0] == student_id:
-                student_details = {
-                    "StudentId": row[0],
-                    "FaceId": row[1],
-                    "Name": row[2],
-                    "MobileNumber": row[3],
-                    "Gender": row[5],
-                    "HostelName": row[6],
-                    "RoomNo": row[7],
-                    "Batch": row[8],
-                    "Course": row[9],
-                    "NEET_JEE": row[10]
-                }
-                fetched_students[student_id] = student_details
-                return jsonify(student_details)
+        row = storage.get_student(student_id)
+        if row is not None:
+            cached = fetched_students.get(student_id)
+            if cached is not None and cached[0] is row:
+                return jsonify(cached[1])
+            student_details = {
+                "StudentId": row[0],
+                "FaceId": row[1],
+                "Name": row[2],
+                "MobileNumber": row[3],
+                "Gender": row[5],
+                "HostelName": row[6],
+                "RoomNo": row[7],
+                "Batch": row[8],
+                "Course": row[9],
+                "NEET_JEE": row[10]
+            }
+            fetched_students[student_id] = (row, student_details)
+            return jsonify(student_details)
         return jsonify({"error": "Student not found"}), 404
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return failure_response(e)
     
 
 @app.route('/fetch_student_requests', methods=['POST'])
@@ -65,18 +358,17 @@ def fetch_student_requests():
     try:
         # Parse incoming request
         data = request.get_json()
-        print("Incoming request data:", data)
+        log.debug("fetch_student_requests payload", extra={"payload": data})
 
         student_id = str(data.get('StudentId')).strip()
         if not student_id:
-            print("Missing StudentId in request")
+            log.info("StudentId missing")
             return jsonify({"error": "StudentId is required"}), 400
 
-        # Fetch rows from Google Sheet
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
-        print("Rows fetched from Google Sheet:", rows)
+        # Look up this student's rows through the StudentId index
+        rows = storage.student_outings(student_id)
+        count_rows(len(rows))
+        log.debug("student outings loaded", extra={"student_id": student_id, "rows": len(rows)})
 
         # Define default values for optional columns
         default_values = {
@@ -89,51 +381,50 @@ def fetch_student_requests():
 
         # Filter rows for the specific student
         student_requests = []
-        for index, row in enumerate(rows):
-            print(f"Processing row {index}: {row}")
+        for row_number, row in rows:
+            index = row_number - 2
+            if sample_row():
+                log.debug("processing row", extra={"row_number": row_number, "row": row})
 
             if len(row) < 12:  # Minimum number of columns to consider
-                print(f"Row {index} has insufficient columns (found {len(row)}): {row}")
+                log.debug("row has too few columns", extra={"row_number": row_number, "columns": len(row)})
                 continue
 
-            row_student_id = str(row[0]).strip()
-            print(f"Row {index}: StudentId = {row_student_id}, Match = {row_student_id == student_id}")
-
-            if row_student_id == student_id:
-                student_requests.append({
-                    "RequestId": index + 1,
-                    "OutDate": row[11] if len(row) > 11 else default_values["OutDate"],
-                    "InDate": row[17] if len(row) > 17 else default_values["InDate"],
-                    "Reason": row[10] if len(row) > 10 else default_values["Reason"],
-                    "Warden_OutApproval": row[13] if len(row) > 13 else default_values["Warden_OutApproval"],
-                    "Warden_InApproval": row[18] if len(row) > 18 else default_values["Warden_InApproval"],
-                })
+            student_requests.append({
+                "RequestId": index + 1,
+                "OutDate": row[11] if len(row) > 11 else default_values["OutDate"],
+                "InDate": row[17] if len(row) > 17 else default_values["InDate"],
+                "Reason": row[10] if len(row) > 10 else default_values["Reason"],
+                "Warden_OutApproval": row[13] if len(row) > 13 else default_values["Warden_OutApproval"],
+                "Warden_InApproval": row[18] if len(row) > 18 else default_values["Warden_InApproval"],
+            })
 
-        print("Filtered student requests:", student_requests)
+        log.debug("student requests found", extra={"student_id": student_id, "count": len(student_requests)})
         if not student_requests:
-            print(f"No requests found for StudentId: {student_id}")
+            log.info("no requests for student", extra={"student_id": student_id})
             return jsonify({"message": "No requests found for the given StudentId"}), 404
 
         return jsonify(student_requests), 200
 
     except KeyError as ke:
-        print("KeyError:", ke)
+        log.warning("missing key in request: %s", ke)
         return jsonify({"error": f"KeyError: {ke}"}), 400
 
     except IndexError as ie:
-        print("IndexError:", ie)
+        log.exception("index error while listing student requests")
         return jsonify({"error": f"IndexError: {ie}"}), 400
 
     except Exception as e:
-        print("Unexpected Error:", e)
-        return jsonify({"error": str(e)}), 500
+        log.exception("listing student requests failed")
+        return failure_response(e)
 
 
 @app.route('/submit_out_request', methods=['POST'])
+@holds_row_layout
 def submit_out_request():
     try:
         data = request.json
-        print("Incoming data:", data)  # Debugging payload
+        log.debug("request payload", extra={"payload": data})
 
         # Extract nested fields
         student_details = data.get('studentDetails', {})
@@ -145,18 +436,13 @@ def submit_out_request():
 
         # Validate required fields
         if not all([student_id, reason, out_date]):
-            print("Missing fields:", {"StudentId": student_id, "Reason": reason, "OutDate": out_date})  # Debugging missing fields
+            log.info("missing fields", extra={"StudentId": student_id, "Reason": reason, "OutDate": out_date})
             return jsonify({"error": "All fields (StudentId, Reason, OutDate) are required"}), 400
 
-        # Fetch existing rows to check for duplicates
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:M").execute()
-        rows = result.get('values', [])
-
-        # Check for duplicate StudentId + OutDate
-        for row in rows:
-            if row[0] == student_id and row[10] == out_date:  # Columns A (StudentId) and K (OutDate)
-                return jsonify({"error": "Request with the same StudentId and OutDate already exists"}), 409
+        # Check for duplicate StudentId + OutDate (columns A and L)
+        existing_row_number, _ = storage.find_outing(student_id, out_date)
+        if existing_row_number is not None:
+            return jsonify({"error": "Request with the same StudentId and OutDate already exists"}), 409
 
         # Prepare and append data
         outing_request = [
@@ -176,24 +462,20 @@ def submit_out_request():
         ]
 
         # Append data to the Google Sheet
-        service.spreadsheets().values().append(
-            spreadsheetId=WARDEN_SHEET_ID,
-            range="Sheet1!A:M",
-            valueInputOption="USER_ENTERED",
-            body={"values": [outing_request]}
-        ).execute()
-
-        print("Outing request submitted:", outing_request)  # Debugging appended data
+        storage.add_outing(outing_request)
+
+        log.info("outing request submitted", extra={"student_id": student_id, "out_date": out_date})
         return jsonify({"message": "Outing request submitted successfully"}), 201
     except Exception as e:
-        print("Error:", e)  # Debugging unexpected exceptions
-        return jsonify({"error": str(e)}), 500
+        log.exception("submitting outing request failed")
+        return failure_response(e)
 
 @app.route('/submit_in_request', methods=['POST'])
+@holds_row_layout
 def submit_in_request():
     try:
         data = request.json
-        print("Incoming data:", data)  # Debugging payload
+        log.debug("request payload", extra={"payload": data})
 
         # Extract nested fields
         student_details = data.get('studentDetails', {})
@@ -204,51 +486,34 @@ def submit_in_request():
 
         # Validate required fields
         if not all([student_id, in_date]):
-            print("Missing fields:", {"StudentId": student_id, "InDate": in_date})  # Debugging missing fields
+            log.info("missing fields", extra={"StudentId": student_id, "InDate": in_date})
             return jsonify({"error": "StudentId and InDate are required"}), 400
 
-        # Fetch existing rows to check for matching StudentId and non-empty OutDate
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:R").execute()
-        rows = result.get('values', [])
+        # Fetch this student's rows to check for a non-empty OutDate
+        rows = storage.student_outings(student_id)
+        count_rows(len(rows))
 
         # Identify the row to update
-        for idx, row in enumerate(rows):
-            # Ensure row has enough columns and check for matching StudentId and existing OutDate
-            if len(row) > 11 and row[0] == student_id and row[11] and row[12] == "OUT":  # Columns A (StudentId) and L (OutDate)
-                # Update InDate in column 12 (L) of the matched row
-                row_number = idx + 2  # Adding 2 to account for header and zero-based index
-                update_range = f"Sheet1!R{row_number}"
-                service.spreadsheets().values().update(
-                    spreadsheetId=WARDEN_SHEET_ID,
-                    range=update_range,
-                    valueInputOption="USER_ENTERED",
-                    body={"values": [[in_date]]}
-                ).execute()
-
-                 # Update Status in column 13 (M) to "IN"
-                status_range = f"Sheet1!M{row_number}"
-                service.spreadsheets().values().update(
-                    spreadsheetId=WARDEN_SHEET_ID,
-                    range=status_range,
-                    valueInputOption="USER_ENTERED",
-                    body={"values": [["IN"]]}
-                ).execute()
-
-                print(f"InDate updated for StudentId {student_id} in row {row_number}")
+        for row_number, row in rows:
+            # Ensure row has enough columns and check for an existing OutDate
+            if len(row) > 12 and row[11] and row[12] == "OUT":  # Columns L (OutDate) and M (Status)
+                # Update InDate in column 18 (R) and Status in column 13 (M) to "IN"
+                storage.request_in(row_number, in_date)
+
+                log.info("in request submitted", extra={"student_id": student_id, "row_id": row_number})
                 return jsonify({"message": "InDate updated successfully"}), 200
 
         # If no matching row is found
-        print(f"No matching entry found for StudentId {student_id} with an OutDate.")
+        log.info("no open outing for student", extra={"student_id": student_id})
         return jsonify({"error": "No existing entry found with the given StudentId and OutDate"}), 404
     except Exception as e:
-        print("Error:", e)  # Debugging unexpected exceptions
-        return jsonify({"error": str(e)}), 500
+        log.exception("submitting in request failed")
+        return failure_response(e)
 
 @app.route('/warden/login', methods=['POST'])
 def warden_login():
     data = request.get_json()
-    app.logger.info(f"Received data: {data}")  # Log the received data
+    log.debug("warden login attempt", extra={"username": data.get('username')})
     username = data.get('username')
     password = data.get('password')
     
@@ -260,146 +525,59 @@ def warden_login():
 @app.route('/warden/out_request_dashboard', methods=['GET'])
 def fetch_warden_out_dashboard():
     try:
-        current_date = datetime.today().date()  # Get today's date
-        print(f"Current date: {current_date}")  # Debugging current date
-        
-        # Fetch all rows from the warden's Google Sheet
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
-
-        # Format the response, handling missing columns gracefully
-        requests = []
-        for row in rows:
-            try:
-                # Check if the row has sufficient columns
-                if len(row) >= 12:  # Ensure that there are at least 12 columns
-                    date_str = row[11]  # OutDate is expected at index 11 (OUT-DATE)
-                    try:
-                        out_date = datetime.strptime(date_str, "%d-%m-%Y").date()
-                        print(f"Parsing OutDate for {row[2]}: {out_date}")  # Debugging OutDate
-                    except ValueError as e:
-                        print(f"Error parsing OutDate for {row[2]}: {date_str} -> {e}")
-                        continue  # Skip rows with invalid date format
-
-                    print(f"Comparing current date {current_date} with OutDate {out_date}")  # Debugging the comparison
-                    
-                    if current_date <= out_date and row[12].upper() == "OUT":
-                        print(f"Checking Status for {row[2]}: {row[12]}")  # Debugging Status
-                        
-                        # Check if Warden Out Approval (row[13]) is empty or contains only whitespace
-                        warden_out_approval = row[13].strip() if len(row) > 13 else ""
-                        print(f"Checking Warden Approval for {row[2]}: '{warden_out_approval}'")  # Debugging Warden Approval
-                        
-                        # Only add to the requests if Warden Out Approval is empty or contains only spaces
-                        if warden_out_approval == "":
-                            # Make sure row has all the required fields, otherwise set them to empty
-                            request = {
-                                "StudentId": row[0] if len(row) > 0 else "",
-                                "FaceId": row[1] if len(row) > 1 else "",
-                                "Name": row[2] if len(row) > 2 else "",
-                                "MobileNumber": row[3] if len(row) > 3 else "",
-                                "Gender": row[4] if len(row) > 4 else "",
-                                "HostelName": row[5] if len(row) > 5 else "",
-                                "RoomNo": row[6] if len(row) > 6 else "",
-                                "Batch": row[7] if len(row) > 7 else "",
-                                "Course": row[8] if len(row) > 8 else "",
-                                "NEET_JEE": row[9] if len(row) > 9 else "",
-                                "Reason": row[10] if len(row) > 10 else "",
-                                "OutDate": row[11] if len(row) > 11 else "",
-                                "Status": row[12] if len(row) > 12 else "",
-                                "Warden_OutApproval": warden_out_approval,
-                                "WardenNameOut": row[14] if len(row) > 14 else "",
-                                "WardenRemarksOut": row[15] if len(row) > 15 else "",
-                                "OutTime": row[16] if len(row) > 16 else "",
-                                "InDate": row[17] if len(row) > 17 else "",
-                                "Warden_InApproval": row[18] if len(row) > 18 else "",
-                                "WardenNameIn": row[19] if len(row) > 19 else "",
-                                "WardenRemarksIn": row[20] if len(row) > 20 else "",
-                                "InTime": row[21] if len(row) > 21 else ""
-                            }
-                            requests.append(request)
-                        else:
-                            print(f"Skipping row due to Warden Out Approval filled for {row[2]}")
-            except Exception as e:
-                # Log the error for the problematic row
-                print(f"Error processing row {row}: {e}")
-
-        return jsonify(requests), 200
+        query = DashboardQuery.from_args(request.args, row_layout.epoch())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Requests dated today or later, still OUT and awaiting the warden
+        version, pending = views.snapshot("warden_out")
+        etag = dashboard_etag("warden_out", version)
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
+        log.debug("pending out requests", extra={"count": len(pending)})
+
+        # Format only the requested page
+        count_rows(len(pending))
+        page, next_cursor = query.page(pending, date_field="out_date", approval_field="out_approval")
+        requests = serialize(outing for _, outing in page)
+        return dashboard_response(query, requests, next_cursor, etag)
     except Exception as e:
-        # Log the error for the entire request
-        print(f"Error fetching warden dashboard: {e}")
-        return jsonify({"error": str(e)}), 500
+        log.exception("warden out dashboard failed")
+        return failure_response(e)
 
 @app.route('/warden/in_request_dashboard', methods=['GET'])
 def fetch_warden_in_dashboard():
     try:
-        current_date = datetime.today().date()  # Get today's date
-        print(f"Current date: {current_date}")  # Debugging current date
-
-        # Fetch all rows from the warden's Google Sheet
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
+        query = DashboardQuery.from_args(request.args, row_layout.epoch())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Format the response, handling missing columns gracefully
-        requests = []
-        for row in rows:
-            try:
-                # Check if the row has sufficient columns
-                if len(row) >= 18:  # Ensure that there are at least 18 columns
-                    date_str = row[17]  # InDate is expected at index 17
-                    try:
-                        in_date = datetime.strptime(date_str, "%d-%m-%Y").date()
-                    except ValueError:
-                        print(f"Invalid InDate format for {row[2]}: {date_str}")
-                        continue  # Skip rows with invalid date format
-
-                    if current_date <= in_date and row[12].upper() == "IN":
-                        warden_out_approval = row[13].strip() if len(row) > 13 else ""
-                        warden_in_approval = row[18].strip() if len(row) > 18 else ""
-
-                        # Only add to the requests if Warden In Approval is empty
-                        if not warden_in_approval:
-                            request = {
-                                "StudentId": row[0] if len(row) > 0 else "",
-                                "FaceId": row[1] if len(row) > 1 else "",
-                                "Name": row[2] if len(row) > 2 else "",
-                                "MobileNumber": row[3] if len(row) > 3 else "",
-                                "Gender": row[4] if len(row) > 4 else "",
-                                "HostelName": row[5] if len(row) > 5 else "",
-                                "RoomNo": row[6] if len(row) > 6 else "",
-                                "Batch": row[7] if len(row) > 7 else "",
-                                "Course": row[8] if len(row) > 8 else "",
-                                "NEET_JEE": row[9] if len(row) > 9 else "",
-                                "Reason": row[10] if len(row) > 10 else "",
-                                "OutDate": row[11] if len(row) > 11 else "",
-                                "Status": row[12] if len(row) > 12 else "",
-                                "Warden_OutApproval": warden_out_approval,
-                                "WardenNameOut": row[14] if len(row) > 14 else "",
-                                "WardenRemarksOut": row[15] if len(row) > 15 else "",
-                                "OutTime": row[16] if len(row) > 16 else "",
-                                "InDate": row[17] if len(row) > 17 else "",
-                                "Warden_InApproval": row[18] if len(row) > 18 else "",
-                                "WardenNameIn": row[19] if len(row) > 19 else "",
-                                "WardenRemarksIn": row[20] if len(row) > 20 else "",
-                                "InTime": row[21] if len(row) > 21 else ""
-                            }
-                            requests.append(request)
-            except Exception as e:
-                print(f"Error processing row {row}: {e}")
-
-        return jsonify(requests), 200
+    try:
+        # Return requests dated today or later, marked IN and awaiting the warden
+        version, pending = views.snapshot("warden_in")
+        etag = dashboard_etag("warden_in", version)
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
+
+        # Format only the requested page
+        count_rows(len(pending))
+        page, next_cursor = query.page(pending, date_field="in_date", approval_field="in_approval")
+        requests = serialize(outing for _, outing in page)
+        return dashboard_response(query, requests, next_cursor, etag)
     except Exception as e:
-        print(f"Error fetching warden dashboard: {e}")
-        return jsonify({"error": "Failed to fetch requests, please try again later."}), 500
+        log.exception("warden in dashboard failed")
+        return failure_response(e, "Failed to fetch requests, please try again later.")
 
 
 @app.route('/warden/update_out_status', methods=['POST'])
+@holds_row_layout
 def update_warden_out_status():
     try:
         data = request.json
-        print("Received data:", data)  # Debugging incoming data
+        log.debug("request payload", extra={"payload": data})
 
         student_id = data.get('StudentId')
         out_date = data.get('OutDate')  # New unique field
@@ -409,86 +587,50 @@ def update_warden_out_status():
 
         # Validate required fields
         if not all([student_id, out_date, approval_status, warden_name]):
-            print("Missing fields:", {
+            log.info("missing fields", extra={
                 "StudentId": student_id,
                 "OutDate": out_date,
                 "ApprovalStatus": approval_status,
                 "WardenName": warden_name,
-            })  # Debugging missing fields
+            })
             return jsonify({"error": "StudentId, OutDate, ApprovalStatus, WardenName are required"}), 400
 
-        # Fetch existing rows from the sheet
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
-        print("Fetched rows:", rows)  # Debugging fetched rows
-
         # Find the row to update where both StudentId and OutDate match
         row_found = False
-        for idx, row in enumerate(rows):
-            if len(row) > 12 and row[0] == student_id and row[11] == out_date and row[12]=="OUT":  # Match StudentId (A) and OutDate (K)
-                range_to_update_status = f"Sheet1!N{idx + 2}"  # Column N for Warden Out approval 
-                range_to_update_warden = f"Sheet1!O{idx + 2}"  # Column O for WardenName
-                range_to_update_remarks = f"Sheet1!P{idx + 2}"  # Column P for Remarks
-                print(f"Updating row {idx + 2}: {range_to_update_status} with status {approval_status}")  # Debugging update action
-
-                # Update the approval status
-                service.spreadsheets().values().update(
-                    spreadsheetId=WARDEN_SHEET_ID,
-                    range=range_to_update_status,
-                    valueInputOption="RAW",
-                    body={"values": [[approval_status]]}
-                ).execute()
-
-                # Update Warden's Name
-                service.spreadsheets().values().update(
-                    spreadsheetId=WARDEN_SHEET_ID,
-                    range=range_to_update_warden,
-                    valueInputOption="RAW",
-                    body={"values": [[warden_name]]}
-                ).execute()
-
-                # Update Remarks
-                service.spreadsheets().values().update(
-                    spreadsheetId=WARDEN_SHEET_ID,
-                    range=range_to_update_remarks,
-                    valueInputOption="RAW",
-                    body={"values": [[remarks]]}
-                ).execute()
+        row_number, row = storage.find_outing(student_id, out_date)
+        count_rows(0 if row is None else 1)
+        if row is not None and len(row) > 12 and row[12] == "OUT":  # Match StudentId (A), OutDate (L) and Status (M)
+            log.info("warden out decision", extra={"row_id": row_number, "status": approval_status})
 
-                row_found = True
-                break  # Stop once the correct row is updated
+            # Update the approval status, Warden's Name and Remarks
+            storage.set_out_approval(row_number, approval_status, warden_name, remarks)
+
+            row_found = True
 
         if row_found:
             student_mobile = "+91" + row[3]  # Assuming the mobile number is in column D
-            print(f"Found mobile number for student {student_id}: {student_mobile}")  # Debugging mobile number
-            print(f"Sending SMS to {student_mobile} about status: {approval_status}")  # Debugging SMS send
+            log.debug("queueing SMS", extra={"student_id": student_id, "status": approval_status})
 
-            try:
-                # Send SMS using Twilio
-                message = client.messages.create(
-                    body=f"Your ward's request has been {approval_status} by Warden {warden_name}. Remarks: {remarks}",
-                    from_=TWILIO_PHONE_NUMBER,
-                    to=student_mobile
-                )
-                print(f"SMS sent successfully with SID: {message.sid}")  # Debugging successful SMS send
-            except Exception as sms_error:
-                print(f"Error sending SMS: {sms_error}")  # Debugging Twilio error
-                return jsonify({"error": "Failed to send SMS"}), 500
+            # Queue the SMS; the outbox workers send it via Twilio and retry on failure
+            outbox.enqueue(
+                student_mobile,
+                f"Your ward's request has been {approval_status} by Warden {warden_name}. Remarks: {remarks}"
+            )
 
             return jsonify({"message": "Status updated successfully"}), 200
         else:
-            print("Request not found for student:", student_id)  # Debugging missing request
+            log.info("matching request not found", extra={"student_id": student_id})
             return jsonify({"error": "Matching request not found"}), 404
     except Exception as e:
-        print("Error:", e)  # Debugging unexpected exceptions
-        return jsonify({"error": str(e)}), 500
+        log.exception("warden decision failed")
+        return failure_response(e)
 
 @app.route('/warden/update_in_status', methods=['POST'])
+@holds_row_layout
 def update_warden_in_status():
     try:
         data = request.json
-        print("Received data:", data)  # Debugging incoming data
+        log.debug("request payload", extra={"payload": data})
 
         student_id = data.get('StudentId')
         in_date = data.get('InDate')  # New unique field
@@ -498,80 +640,143 @@ def update_warden_in_status():
 
         # Validate required fields
         if not all([student_id, in_date, approval_status, warden_name]):
-            print("Missing fields:", {
+            log.info("missing fields", extra={
                 "StudentId": student_id,
                 "InDate": in_date,
                 "ApprovalStatus": approval_status,
                 "WardenName": warden_name,
-            })  # Debugging missing fields
+            })
             return jsonify({"error": "StudentId, InDate, ApprovalStatus, WardenName are required"}), 400
 
-        # Fetch existing rows from the sheet
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
-        print("Fetched rows:", rows)  # Debugging fetched rows
+        # Fetch this student's rows from the sheet
+        rows = storage.student_outings(student_id)
+        count_rows(len(rows))
 
-        # Find the row to update where both StudentId and OutDate match
+        # Find the row to update where both StudentId and InDate match
         row_found = False
-        for idx, row in enumerate(rows):
-            if len(row) > 12 and row[0] == student_id and row[17] == in_date and row[12]=="IN":  # Match StudentId (A) and OutDate (K)
-                range_to_update_status = f"Sheet1!S{idx + 2}"  # Column N for Warden Out approval 
-                range_to_update_warden = f"Sheet1!T{idx + 2}"  # Column O for WardenName
-                range_to_update_remarks = f"Sheet1!U{idx + 2}"  # Column P for Remarks
-                print(f"Updating row {idx + 2}: {range_to_update_status} with status {approval_status}")  # Debugging update action
-
-                # Update the approval status
-                service.spreadsheets().values().update(
-                    spreadsheetId=WARDEN_SHEET_ID,
-                    range=range_to_update_status,
-                    valueInputOption="RAW",
-                    body={"values": [[approval_status]]}
-                ).execute()
-
-                # Update Warden's Name
-                service.spreadsheets().values().update(
-                    spreadsheetId=WARDEN_SHEET_ID,
-                    range=range_to_update_warden,
-                    valueInputOption="RAW",
-                    body={"values": [[warden_name]]}
-                ).execute()
-
-                # Update Remarks
-                service.spreadsheets().values().update(
-                    spreadsheetId=WARDEN_SHEET_ID,
-                    range=range_to_update_remarks,
-                    valueInputOption="RAW",
-                    body={"values": [[remarks]]}
-                ).execute()
+        for row_number, row in rows:
+            if len(row) > 17 and row[17] == in_date and row[12]=="IN":  # Match InDate (R) and Status (M)
+                log.info("warden in decision", extra={"row_id": row_number, "status": approval_status})
+
+                # Update the approval status, Warden's Name and Remarks
+                storage.set_in_approval(row_number, approval_status, warden_name, remarks)
 
                 row_found = True
                 break  # Stop once the correct row is updated
 
         if row_found:
             student_mobile = "+91" + row[3]  # Assuming the mobile number is in column D
-            print(f"Found mobile number for student {student_id}: {student_mobile}")  # Debugging mobile number
-            print(f"Sending SMS to {student_mobile} about status: {approval_status}")  # Debugging SMS send
+            log.debug("queueing SMS", extra={"student_id": student_id, "status": approval_status})
 
-            try:
-                # Send SMS using Twilio
-                message = client.messages.create(
-                    body=f"Your ward's request has been {approval_status} by Warden {warden_name}. Remarks: {remarks}",
-                    from_=TWILIO_PHONE_NUMBER,
-                    to=student_mobile
-                )
-                print(f"SMS sent successfully with SID: {message.sid}")  # Debugging successful SMS send
-            except Exception as sms_error:
-                print(f"Error sending SMS: {sms_error}")  # Debugging Twilio error
-                return jsonify({"error": "Failed to send SMS"}), 500
+            # Queue the SMS; the outbox workers send it via Twilio and retry on failure
+            outbox.enqueue(
+                student_mobile,
+                f"Your ward's request has been {approval_status} by Warden {warden_name}. Remarks: {remarks}"
+            )
 
             return jsonify({"message": "Status updated successfully"}), 200
         else:
-            print("Request not found for student:", student_id)  # Debugging missing request
+            log.info("matching request not found", extra={"student_id": student_id})
             return jsonify({"error": "Matching request not found"}), 404
     except Exception as e:
-        print("Error:", e)  # Debugging unexpected exceptions
-        return jsonify({"error": str(e)}), 500
+        log.exception("warden decision failed")
+        return failure_response(e)
+
+
+# Most decisions one bulk request may carry
+BULK_DECISION_LIMIT = int(os.getenv("BULK_DECISION_LIMIT", "500"))
+
+
+def apply_warden_decisions(date_key, locate, set_approvals):
+    # Shared by the bulk approval routes. Rows are looked up in the cached
+    # sheet, every decision is written in one batch and the SMS messages are
+    # queued together; each entry gets its own result, in request order.
+    data = request.json or {}
+    log.debug("request payload", extra={"payload": data})
+
+    warden_name = data.get('WardenName')
+    decisions = data.get('Decisions')
+    if not warden_name or not isinstance(decisions, list) or not decisions:
+        return jsonify({"error": "WardenName and a non-empty Decisions list are required"}), 400
+    if len(decisions) > BULK_DECISION_LIMIT:
+        return jsonify({"error": f"At most {BULK_DECISION_LIMIT} decisions per request"}), 400
+
+    results = []
+    accepted = []  # (result, row_id, row, approval_status, remarks)
+    seen_rows = set()
+    for entry in decisions:
+        entry = entry if isinstance(entry, dict) else {}
+        student_id = entry.get('StudentId')
+        day = entry.get(date_key)
+        approval_status = entry.get('ApprovalStatus')
+        remarks = entry.get('Remarks')
+        result = {"StudentId": student_id, date_key: day}
+        results.append(result)
+
+        if not all([student_id, day, approval_status]):
+            result.update(status=400, error=f"StudentId, {date_key}, ApprovalStatus are required")
+            continue
+        row_number, row = locate(student_id, day)
+        if row is None:
+            result.update(status=404, error="Matching request not found")
+        elif row_number in seen_rows:
+            result.update(status=409, error="Request already decided earlier in this batch")
+        else:
+            seen_rows.add(row_number)
+            accepted.append((result, row_number, row, approval_status, remarks))
+
+    if accepted:
+        set_approvals([(row_number, approval_status, warden_name, remarks)
+                       for _, row_number, _, approval_status, remarks in accepted])
+        # Queue the SMS messages; the outbox workers send them via Twilio and retry on failure
+        outbox.enqueue_many([
+            ("+91" + row[3],
+             f"Your ward's request has been {approval_status} by Warden {warden_name}. Remarks: {remarks}")
+            for _, _, row, approval_status, remarks in accepted
+        ])
+        for result, *_ in accepted:
+            result.update(status=200, message="Status updated successfully")
+
+    log.info("bulk warden decisions", extra={
+        "requested": len(decisions), "updated": len(accepted), "warden": warden_name})
+    return jsonify({"updated": len(accepted), "results": results}), 200
+
+
+def find_pending_out(student_id, out_date):
+    row_number, row = storage.find_outing(student_id, out_date)
+    count_rows(0 if row is None else 1)
+    if row is not None and len(row) > 12 and row[12] == "OUT":  # Match StudentId (A), OutDate (L) and Status (M)
+        return row_number, row
+    return None, None
+
+
+def find_pending_in(student_id, in_date):
+    rows = storage.student_outings(student_id)
+    count_rows(len(rows))
+    for row_number, row in rows:
+        if len(row) > 17 and row[17] == in_date and row[12] == "IN":  # Match InDate (R) and Status (M)
+            return row_number, row
+    return None, None
+
+
+@app.route('/warden/bulk_update_out_status', methods=['POST'])
+@holds_row_layout
+def bulk_update_warden_out_status():
+    try:
+        return apply_warden_decisions('OutDate', find_pending_out, storage.set_out_approvals)
+    except Exception as e:
+        log.exception("bulk warden decision failed")
+        return failure_response(e)
+
+
+@app.route('/warden/bulk_update_in_status', methods=['POST'])
+@holds_row_layout
+def bulk_update_warden_in_status():
+    try:
+        return apply_warden_decisions('InDate', find_pending_in, storage.set_in_approvals)
+    except Exception as e:
+        log.exception("bulk warden decision failed")
+        return failure_response(e)
 
     
 # Guard login
@@ -589,257 +794,394 @@ def guard_login():
 @app.route('/guard/out_dashboard', methods=['GET'])
 def guard_out_dashboard():
     try:
-        print("Guard Dashboard API called.")
-        print("Fetching data from spreadsheet...")
-        
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
-        print(f"Total rows fetched: {len(rows)}")  # Debugging: Total rows fetched
-        print("Raw rows fetched:", rows)  # Debugging: Inspect raw rows
-
-        print("Filtering rows based on approval status...")
-        filtered_rows = []
-        for row in rows:
-            if len(row) >= 14 and row[12]=="OUT" and row[13]:  # Ensure sufficient columns
-                approval_status = row[13].strip().upper()
-                print(f"Approval status: {approval_status}")  # Debugging: Check each status
-                if approval_status in ["APPROVED", "REJECTED"]:
-                    filtered_rows.append(row)
-        print(f"Filtered rows count: {len(filtered_rows)}")  # Debugging: Filtered rows count
-        print("Rows passing filter condition:", filtered_rows)  # Debugging: Rows passing condition
-
-        # Format the response
-        print("Formatting the response...")
-        requests = []
-        for row in filtered_rows:
-            requests.append({
-                "StudentId": row[0],
-                "FaceId": row[1],
-                "Name": row[2],
-                "MobileNumber": row[3],
-                "Gender": row[4],
-                "HostelName": row[5],
-                "RoomNo": row[6],
-                "Batch": row[7],
-                "Course": row[8],
-                "NEET_JEE": row[9],
-                "Reason": row[10],
-                "OutDate": row[11],
-                "Status": row[12],
-                "Warden_OutApproval": row[13],
-                "WardenNameOut": row[14] if len(row) > 14 else "",
-                "WardenRemarksOut": row[15] if len(row) > 15 else "",
-                "OutTime": row[16] if len(row) > 16 else "",
-                "InDate": row[17] if len(row) > 17 else "",
-                "Warden_InApproval": row[18] if len(row) > 18 else "",
-                "WardenNameIn": row[19] if len(row) > 19 else "",
-                "WardenRemarksIn": row[20] if len(row) > 20 else "",
-                "InTime": row[21] if len(row) > 21 else "",
-            })
-        print("Response formatting complete.")  # Debugging: Confirm response formatting
-        return jsonify(requests), 200
+        query = DashboardQuery.from_args(request.args, row_layout.epoch())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Requests the warden has approved or rejected, still OUT
+        version, filtered_rows = views.snapshot("guard_out")
+        etag = dashboard_etag("guard_out", version)
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
+        log.debug("guard dashboard rows", extra={"count": len(filtered_rows)})
+
+        # Format only the requested page
+        count_rows(len(filtered_rows))
+        page, next_cursor = query.page(filtered_rows, date_field="out_date", approval_field="out_approval")
+        requests = serialize(outing for _, outing in page)
+        return dashboard_response(query, requests, next_cursor, etag)
     except Exception as e:
-        print(f"Error occurred: {str(e)}")  # Debugging: Log errors
-        return jsonify({"error": str(e)}), 500
+        log.exception("guard dashboard failed")
+        return failure_response(e)
 
 @app.route('/guard/in_dashboard', methods=['GET'])
 def guard_in_dashboard():
     try:
-        print("Guard Dashboard API called.")
-        print("Fetching data from spreadsheet...")
-        
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
-        print(f"Total rows fetched: {len(rows)}")  # Debugging: Total rows fetched
-        print("Raw rows fetched:", rows)  # Debugging: Inspect raw rows
-
-        print("Filtering rows based on approval status...")
-        filtered_rows = []
-        for row in rows:
-            if len(row) >= 19 and row[12]=="IN" and row[18]:  # Ensure sufficient columns
-                approval_status = row[18].strip().upper()
-                print(f"Approval status: {approval_status}")  # Debugging: Check each status
-                if approval_status in ["APPROVED", "REJECTED"]:
-                    filtered_rows.append(row)
-        print(f"Filtered rows count: {len(filtered_rows)}")  # Debugging: Filtered rows count
-        print("Rows passing filter condition:", filtered_rows)  # Debugging: Rows passing condition
-
-        # Format the response
-        print("Formatting the response...")
-        requests = []
-        for row in filtered_rows:
-            requests.append({
-                "StudentId": row[0],
-                "FaceId": row[1],
-                "Name": row[2],
-                "MobileNumber": row[3],
-                "Gender": row[4],
-                "HostelName": row[5],
-                "RoomNo": row[6],
-                "Batch": row[7],
-                "Course": row[8],
-                "NEET_JEE": row[9],
-                "Reason": row[10],
-                "OutDate": row[11],
-                "Status": row[12],
-                "Warden_OutApproval": row[13],
-                "WardenNameOut": row[14] if len(row) > 14 else "",
-                "WardenRemarksOut": row[15] if len(row) > 15 else "",
-                "OutTime": row[16] if len(row) > 16 else "",
-                "InDate": row[17] if len(row) > 17 else "",
-                "Warden_InApproval": row[18] if len(row) > 18 else "",
-                "WardenNameIn": row[19] if len(row) > 19 else "",
-                "WardenRemarksIn": row[20] if len(row) > 20 else "",
-                "InTime": row[21] if len(row) > 21 else "",
-            })
-        print("Response formatting complete.")  # Debugging: Confirm response formatting
-        return jsonify(requests), 200
+        query = DashboardQuery.from_args(request.args, row_layout.epoch())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Requests the warden has approved or rejected, still IN
+        version, filtered_rows = views.snapshot("guard_in")
+        etag = dashboard_etag("guard_in", version)
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
+        log.debug("guard dashboard rows", extra={"count": len(filtered_rows)})
+
+        # Format only the requested page
+        count_rows(len(filtered_rows))
+        page, next_cursor = query.page(filtered_rows, date_field="in_date", approval_field="in_approval")
+        requests = serialize(outing for _, outing in page)
+        return dashboard_response(query, requests, next_cursor, etag)
     except Exception as e:
-        print(f"Error occurred: {str(e)}")  # Debugging: Log errors
-        return jsonify({"error": str(e)}), 500
+        log.exception("guard dashboard failed")
+        return failure_response(e)
+
+# Most matches one guard search returns
+GUARD_SEARCH_LIMIT = int(os.getenv("GUARD_SEARCH_LIMIT", "50"))
+
 
 # Guard search for specific student
 @app.route('/guard/search', methods=['POST'])
 def guard_search():
     try:
+        query = request.json.get('Query')
+        if query is not None:
+            # {"Query": "ram 10", "Limit": 20}: ranked prefix matches on
+            # Name, RoomNo, HostelName and FaceId
+            try:
+                limit = min(int(request.json.get('Limit', 20)), GUARD_SEARCH_LIMIT)
+            except (TypeError, ValueError):
+                return jsonify({"error": "Limit must be a number"}), 400
+            matches = search_index.search(str(query), limit)
+            count_rows(len(matches))
+            return jsonify({"results": serialize([outing for _, outing in matches])}), 200
+
         student_id = request.json.get('StudentId')
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
+        rows = storage.student_outings(student_id)
+        count_rows(len(rows))
 
         # Search for the student
-        for row in rows:
-            if row[0] == student_id and len(row) > 14 and row[14].strip() in ["APPROVED", "NOT APPROVED"]:
-                return jsonify({
-                "StudentId": row[0],
-                "FaceId": row[1],
-                "Name": row[2],
-                "MobileNumber": row[3],
-                "Gender": row[4],
-                "HostelName": row[5],
-                "RoomNo": row[6],
-                "Batch": row[7],
-                "Course": row[8],
-                "NEET_JEE": row[9],
-                "Reason": row[10],
-                "OutDate": row[11],
-                "Status": row[12],
-                "Warden_OutApproval": row[13],
-                "WardenNameOut": row[14] if len(row) > 14 else "",
-                "WardenRemarksOut": row[15] if len(row) > 15 else "",
-                "OutTime": row[16] if len(row) > 16 else "",
-                "InDate": row[17] if len(row) > 17 else "",
-                "Warden_InApproval": row[18] if len(row) > 18 else "",
-                "WardenNameIn": row[19] if len(row) > 19 else "",
-                "WardenRemarksIn": row[20] if len(row) > 20 else "",
-                "InTime": row[21] if len(row) > 21 else "",
-                }), 200
+        for _, row in rows:
+            outing = Outing.from_row(row)
+            if outing.out_warden.strip() in ["APPROVED", "NOT APPROVED"]:
+                return jsonify(outing.to_dict()), 200
 
         return jsonify({"error": "Student not found or request not approved"}), 404
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return failure_response(e)
+
+def journal_gate_scan(data):
+    # One scan, {StudentId, Status, Time[, EventId]}: journaled and
+    # acknowledged with 202; GET /guard/events/<EventId> reports whether it
+    # has reached the sheet. A terminal resending an EventId gets the same
+    # answer without a second scan being recorded.
+    student_id = data.get('StudentId')
+    status = data.get('Status')
+    current_time = data.get('Time')  # Time when button was pressed
+    if not student_id or status not in ("OUT", "IN"):
+        return jsonify({"error": "StudentId and a Status of OUT or IN are required"}), 400
+
+    event_id, = gate_journal.record([(data.get('EventId'), student_id, status, current_time)])
+    log.info("gate event journaled", extra={
+        "student_id": student_id, "status": status, "time": current_time, "event_id": event_id})
+    return jsonify({"message": "Status recorded", "EventId": event_id}), 202
+
 
 @app.route('/guard/update_out_status', methods=['POST'])
 def update_out_status():
     try:
         # Get JSON data from the request
-        data = request.get_json()
-        print("Received data for OUT status:", data)
-
-        student_id = data.get('StudentId')
-        status = data.get('Status')
-        current_time = data.get('Time')  # Time when button was pressed
-        print(f"Student ID: {student_id}, Status: {status}, Time: {current_time}")
-
-        # Fetch rows from the sheet
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
-        print("Fetched rows from sheet:", rows)
-
-        # Find the row for the given student and update
-        for row in rows:
-            if row[0] == student_id:
-                print("Found student row:", row)
-
-                # Ensure there are enough columns (17 columns for OUT time at index 16)
-                while len(row) <= 16:
-                    row.append('')
-
-                row[12] = status  # Update STATUS column
-                if status == 'OUT':
-                    row[16] = current_time  # Record OUT TIME
-                    print(f"Updated OUT time for student {student_id} at {current_time}")
-                break
-        else:
-            print(f"Student ID {student_id} not found in the sheet.")
-
-        # Write the updated rows back to the sheet
-        service.spreadsheets().values().update(
-            spreadsheetId=WARDEN_SHEET_ID,
-            range="Sheet1!A2:V",
-            valueInputOption="RAW",
-            body={"values": rows},
-        ).execute()
-        print("Updated rows written back to sheet.")
-
-        return jsonify({"message": "Status updated successfully"}), 200
+        data = request.get_json() or {}
+        log.debug("request payload", extra={"payload": data})
+        # Replicated as a write of the Status (M) and OUT TIME (Q) cells of the student's row
+        return journal_gate_scan(data)
 
     except Exception as e:
-        print("Error occurred while updating OUT status:", e)
-        return jsonify({"error": str(e)}), 500
+        log.exception("recording OUT gate event failed")
+        return failure_response(e)
 
 @app.route('/guard/update_in_status', methods=['POST'])
 def update_in_status():
     try:
         # Get JSON data from the request
-        data = request.get_json()
-        print("Received data for IN status:", data)
+        data = request.get_json() or {}
+        log.debug("request payload", extra={"payload": data})
+        # Replicated as a write of the Status (M) and IN TIME (V) cells of the student's row
+        return journal_gate_scan(data)
 
-        student_id = data.get('StudentId')
-        status = data.get('Status')
-        current_time = data.get('Time')  # Time when button was pressed
-        print(f"Student ID: {student_id}, Status: {status}, Time: {current_time}")
-
-        # Fetch rows from the sheet
-        result = service.spreadsheets().values().get(
-            spreadsheetId=WARDEN_SHEET_ID, range="Sheet1!A2:V").execute()
-        rows = result.get('values', [])
-        print("Fetched rows from sheet:", rows)
-
-        # Find the row for the given student and update
-        for row in rows:
-            if row[0] == student_id:
-                print("Found student row:", row)
-                
-                # Ensure there are enough columns (21 columns for IN time)
-                while len(row) <= 21:  # Add empty columns until the row has 22 columns
-                    row.append('')
-
-                row[12] = status  # Update STATUS column
-                if status == 'IN':
-                    row[21] = current_time  # Record IN TIME
-                    print(f"Updated IN time for student {student_id} at {current_time}")
-                break
-        else:
-            print(f"Student ID {student_id} not found in the sheet.")
+    except Exception as e:
+        log.exception("recording IN gate event failed")
+        return failure_response(e)
+
+
+# Most scans one gate batch may carry
+BULK_GATE_EVENT_LIMIT = int(os.getenv("BULK_GATE_EVENT_LIMIT", "500"))
 
-        # Write the updated rows back to the sheet
-        service.spreadsheets().values().update(
-            spreadsheetId=WARDEN_SHEET_ID,
-            range="Sheet1!A2:V",
-            valueInputOption="RAW",
-            body={"values": rows},
-        ).execute()
-        print("Updated rows written back to sheet.")
 
-        return jsonify({"message": "Status updated successfully"}), 200
+@app.route('/guard/bulk_update_status', methods=['POST'])
+def bulk_update_gate_status():
+    # A gate terminal flushes its queued scans here: {"Events": [{StudentId,
+    # Status, Time[, EventId]}, ...]}. Valid scans are journaled in one
+    # transaction, in request order, and each gets its own result.
+    try:
+        data = request.get_json() or {}
+        log.debug("request payload", extra={"payload": data})
+
+        events = data.get('Events')
+        if not isinstance(events, list) or not events:
+            return jsonify({"error": "A non-empty Events list is required"}), 400
+        if len(events) > BULK_GATE_EVENT_LIMIT:
+            return jsonify({"error": f"At most {BULK_GATE_EVENT_LIMIT} events per request"}), 400
+
+        results = []
+        accepted = []  # (result, event)
+        for event in events:
+            event = event if isinstance(event, dict) else {}
+            student_id = event.get('StudentId')
+            status = event.get('Status')
+            current_time = event.get('Time')  # Time when the student was scanned
+            result = {"StudentId": student_id, "Time": current_time}
+            results.append(result)
+
+            if not student_id or status not in ("OUT", "IN"):
+                result.update(status=400, error="StudentId and a Status of OUT or IN are required")
+                continue
+            accepted.append((result, (event.get('EventId'), student_id, status, current_time)))
+
+        if accepted:
+            event_ids = gate_journal.record([event for _, event in accepted])
+            for (result, _), event_id in zip(accepted, event_ids):
+                result.update(status=202, message="Status recorded", EventId=event_id)
 
+        log.info("gate events journaled", extra={"requested": len(events), "recorded": len(accepted)})
+        return jsonify({"recorded": len(accepted), "results": results}), 200
+
+    except Exception as e:
+        log.exception("recording gate events failed")
+        return failure_response(e)
+
+
+# Where a journaled scan stands: pending, applied to the sheet, or rejected
+# (with an error, e.g. the student has no outing)
+@app.route('/guard/events/<event_id>', methods=['GET'])
+def gate_event_status(event_id):
+    event = gate_journal.event(event_id)
+    if event is None:
+        return jsonify({"error": "Event not found"}), 404
+    return jsonify(event), 200
+
+
+# A student's outings including archived ones, optionally limited to OutDate
+# months: /history?StudentId=...&since=YYYY-MM&until=YYYY-MM
+@app.route('/history', methods=['GET'])
+def outing_history():
+    try:
+        student_id = request.args.get('StudentId', '').strip()
+        if not student_id:
+            return jsonify({"error": "StudentId is required"}), 400
+        since = request.args.get('since')
+        until = request.args.get('until')
+
+        live = [Outing.from_row(row) for _, row in storage.student_outings(student_id)]
+        live = [outing for outing in live
+                if (not since or month_of(outing) >= since) and (not until or month_of(outing) <= until)]
+        archived = [Outing.from_row(row) for row in archive.student_rows(student_id, since, until)]
+        count_rows(len(live) + len(archived))
+
+        # A row the archiver could not remove yet is in both; the live copy wins
+        live_keys = {(o.out_date, o.in_date) for o in live}
+        records = [dict(outing.to_dict(), Archived=True) for outing in archived
+                   if (outing.out_date, outing.in_date) not in live_keys]
+        records += [dict(outing.to_dict(), Archived=False) for outing in live]
+        return jsonify(records), 200
+    except Exception as e:
+        log.exception("history lookup failed")
+        return failure_response(e)
+
+
+@functools.lru_cache(maxsize=None)
+def reports():
+    from analytics import Reports  # Imported here to keep start-up fast
+    return Reports(storage, archive)
+
+
+def report_range():
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD on OutDate, both optional and inclusive;
+    # raises ValueError for anything else
+    return tuple(date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                 for name in ("from", "to"))
+
+
+# Students still out after their InDate, longest overdue first
+@app.route('/reports/overdue', methods=['GET'])
+def overdue_report():
+    try:
+        from analytics import overdue
+        frame = reports().frame()
+        today = datetime.today().date()
+        indices, days = overdue(frame, today)
+        count_rows(len(frame))
+        students = []
+        for idx, days_overdue in zip(indices, days):
+            record = frame.outings[idx].to_dict()
+            students.append(dict({column: record[column] for column in (
+                "StudentId", "Name", "MobileNumber", "HostelName", "RoomNo", "OutDate", "OutTime", "InDate")},
+                DaysOverdue=int(days_overdue)))
+        return jsonify({"asOf": today.isoformat(), "count": len(students), "students": students}), 200
     except Exception as e:
-        print("Error occurred while updating IN status:", e)
-        return jsonify({"error": str(e)}), 500
+        log.exception("overdue report failed")
+        return failure_response(e)
+
+
+# Outings per hostel, batch, course and OutDate, decisions and average
+# length, for OutDates in ?from=...&to=...
+@app.route('/reports/summary', methods=['GET'])
+def summary_report():
+    try:
+        from analytics import summary
+        try:
+            since, until = report_range()
+        except ValueError:
+            return jsonify({"error": "from and to must be YYYY-MM-DD dates"}), 400
+        frame = reports().frame()
+        count_rows(len(frame))
+        return jsonify(summary(frame, frame.between(since, until))), 200
+    except Exception as e:
+        log.exception("summary report failed")
+        return failure_response(e)
+
+
+# Every outing, live and archived, with an OutDate in ?from=...&to=..., as
+# CSV streamed in chunks
+@app.route('/reports/outings.csv', methods=['GET'])
+def export_outings():
+    try:
+        from analytics import export_csv
+        try:
+            since, until = report_range()
+        except ValueError:
+            return jsonify({"error": "from and to must be YYYY-MM-DD dates"}), 400
+        frame = reports().frame()
+        count_rows(len(frame))
+        name = f"outings_{since or 'start'}_{until or 'end'}.csv"
+        return Response(export_csv(frame, frame.between(since, until)), mimetype="text/csv",
+                        headers={"Content-Disposition": f'attachment; filename="{name}"'})
+    except Exception as e:
+        log.exception("outings export failed")
+        return failure_response(e)
+
+
+# Push dashboard changes as Server-Sent Events
+@app.route('/dashboard/events', methods=['GET'])
+def dashboard_events():
+    names = [name.strip() for name in request.args.get('views', '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in VIEWS]
+    if unknown:
+        return jsonify({"error": f"Unknown views: {', '.join(unknown)}"}), 400
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return jsonify({"error": "Invalid event id"}), 400
+
+    def stream(since):
+        # Each change is one event; a "reset" event means the client missed
+        # some and should refetch its dashboard
+        yield "retry: 3000\n\n"
+        while True:
+            seq, changes = views.wait_for_changes(since, names or None, timeout=EVENT_STREAM_KEEPALIVE)
+            if changes is None:
+                yield f"id: {seq}\nevent: reset\ndata: {{}}\n\n"
+            elif not changes:
+                yield ": keepalive\n\n"
+            for change_seq, view, action, row_id, outing in changes or []:
+                data = {"view": view, "action": action, "RowId": row_id}
+                if outing is not None:
+                    data["record"] = outing.to_dict()
+                yield f"id: {change_seq}\nevent: change\ndata: {json.dumps(data)}\n\n"
+            since = seq
+
+    return Response(stream(since), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def sheet_cache_lookups():
+    cache = getattr(storage, "rows", None)
+    if cache is None:
+        return []
+    return [({"result": "hit"}, cache.hits), ({"result": "miss"}, cache.misses)]
+
+
+def student_lookups():
+    students = getattr(storage, "students", None)
+    if students is None:
+        return []
+    return [({"result": "hit"}, students.hits), ({"result": "miss"}, students.misses)]
+
+
+def sheet_cache_refresh_failures():
+    cache = getattr(storage, "rows", None)
+    return [({}, cache.refresh_failures)] if cache is not None else []
+
+
+def sheet_cache_hit_ratio():
+    lookups = dict((labels["result"], value) for labels, value in sheet_cache_lookups())
+    total = sum(lookups.values())
+    return [({}, lookups["hit"] / total)] if total else []
+
+
+REGISTRY.register(Collected(
+    "sheet_cache_lookups_total", "Warden sheet reads served from memory (hit) or fetched (miss).",
+    sheet_cache_lookups, kind="counter"))
+REGISTRY.register(Collected(
+    "sheet_cache_refresh_failures_total", "Warden sheet reloads that failed while cached rows kept being served.",
+    sheet_cache_refresh_failures, kind="counter"))
+REGISTRY.register(Collected(
+    "sheet_cache_hit_ratio", "Share of warden sheet reads served from memory.", sheet_cache_hit_ratio))
+REGISTRY.register(Collected(
+    "sheets_gate_events_total", "Sheets reads shared with a concurrent caller, retries and throttled calls.",
+    lambda: [({"event": "coalesced"}, sheets_gate.coalesced), ({"event": "retry"}, sheets_gate.retries),
+             ({"event": "throttled"}, sheets_gate.throttled)],
+    kind="counter"))
+REGISTRY.register(Collected(
+    "student_lookups_total", "Student lookups answered from the in-memory directory (hit) or not found (miss).",
+    student_lookups, kind="counter"))
+REGISTRY.register(Collected(
+    "fetched_students_lookups_total", "fetch_student responses reused from the LRU (hit) or built (miss).",
+    lambda: [({"result": "hit"}, fetched_students.hits), ({"result": "miss"}, fetched_students.misses)],
+    kind="counter"))
+REGISTRY.register(Collected(
+    "outings_archived_total", "Closed outings moved from the live storage to the archive.",
+    lambda: [({}, archiver.archived)], kind="counter"))
+REGISTRY.register(Collected(
+    "sheets_clients", "Pooled Sheets API clients, built and currently in use.",
+    lambda: [({"state": "built"}, sheets_pool.built), ({"state": "in_use"}, sheets_pool.in_use)]))
+REGISTRY.register(Collected(
+    "gate_journal_events", "Journaled guard scans by replication state.",
+    lambda: [({"state": state}, count) for state, count in sorted(gate_journal.counts().items())]))
+REGISTRY.register(Collected(
+    "gate_journal_lag_seconds", "Age of the oldest guard scan not yet replicated.",
+    lambda: [({}, gate_journal.lag())]))
+REGISTRY.register(Collected(
+    "curfew_alerts_total", "Students reported as not back by curfew.",
+    lambda: [({}, curfew_watch.alerted)], kind="counter"))
+REGISTRY.register(Collected(
+    "curfew_deadlines", "Students out with a return deadline still ahead.",
+    lambda: [({}, len(curfew_watch))]))
+REGISTRY.register(Collected(
+    "sms_outbox_messages", "SMS outbox messages by delivery status.",
+    lambda: [({"status": status}, count) for status, count in sorted(outbox.counts().items())]))
+
+
+# Prometheus text exposition of the metrics above
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == '__main__':
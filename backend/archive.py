@@ -0,0 +1,307 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from dashboard_views import DECIDED
+from outing import Outing, Status
+from workers import OncePerProcess, create_lease_table, hold_lease, start_daemon
+
+log = logging.getLogger(__name__)
+
+
+def is_closed(outing):
+    """True once the student is back: Status IN, the return decided and InTime recorded."""
+    return (outing.status is Status.IN and outing.in_approval in DECIDED
+            and bool(outing.in_time.strip()))
+
+
+def month_of(outing):
+    # Partition key, "YYYY-MM" of the OutDate
+    return outing.out_date.strftime("%Y-%m") if isinstance(outing.out_date, date) else "unknown"
+
+
+class SharedLock:
+    """Many holders share it, or one holds it exclusively.
+
+    Archiving deletes warden-sheet rows, which renumbers the rows after
+    them. Requests that look a row up and then write to it hold the lock
+    shared; the archiver takes it exclusively. Once the archiver is
+    waiting, new shared holders queue behind it.
+
+    With ``path``, the lock also holds across the worker processes sharing
+    that file, through ``flock`` on it and on ``path + ".gate"`` (which
+    queues new shared holders behind a waiting archiver in other processes
+    too). The file keeps an epoch that ``release_exclusive(renumbered=True)``
+    bumps. ``acquire_shared`` and ``epoch`` call ``on_renumbered()`` the
+    first time this process sees a new epoch, so that it drops the row
+    numbers it cached before they are used.
+    """
+
+    def __init__(self, path=None, on_renumbered=None):
+        self.path = path
+        self.on_renumbered = on_renumbered
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._waiting = 0
+        self._files = None
+        self._epoch = 0
+        self._seen_epoch = 0
+        self._epoch_lock = threading.Lock()
+
+    def _lock_files(self):
+        # (layout fd, gate fd), opened once per process: flock locks belong
+        # to the open file, which a forked worker would share with its parent
+        import fcntl
+        if self._files is None or self._files[0] != os.getpid():
+            self._files = (os.getpid(), os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644),
+                           os.open(self.path + ".gate", os.O_RDWR | os.O_CREAT, 0o644))
+        return fcntl, self._files[1], self._files[2]
+
+    def acquire_shared(self):
+        with self._cond:
+            while self._exclusive or self._waiting:
+                self._cond.wait()
+            if not self._shared and self.path:
+                # The first holder in this process takes the file lock for all
+                fcntl, layout, gate = self._lock_files()
+                fcntl.flock(gate, fcntl.LOCK_SH)
+                try:
+                    fcntl.flock(layout, fcntl.LOCK_SH)
+                finally:
+                    fcntl.flock(gate, fcntl.LOCK_UN)
+            self._shared += 1
+        self.epoch()
+
+    def release_shared(self):
+        with self._cond:
+            self._shared -= 1
+            if not self._shared:
+                if self.path:
+                    fcntl, layout, _ = self._lock_files()
+                    fcntl.flock(layout, fcntl.LOCK_UN)
+                self._cond.notify_all()
+
+    def acquire_exclusive(self):
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self._exclusive or self._shared:
+                    self._cond.wait()
+            finally:
+                self._waiting -= 1
+            self._exclusive = True
+        if self.path:
+            try:
+                fcntl, layout, gate = self._lock_files()
+                fcntl.flock(gate, fcntl.LOCK_EX)
+                fcntl.flock(layout, fcntl.LOCK_EX)
+            except BaseException:
+                self._release_files()
+                with self._cond:
+                    self._exclusive = False
+                    self._cond.notify_all()
+                raise
+
+    def release_exclusive(self, renumbered=False):
+        """Release; ``renumbered`` says rows were removed while it was held."""
+        if renumbered:
+            epoch = self._read_epoch() + 1
+            if self.path:
+                os.pwrite(self._lock_files()[1], str(epoch).encode().ljust(20), 0)
+            self._epoch = epoch
+            with self._epoch_lock:
+                self._seen_epoch = epoch  # The holder already knows
+        if self.path:
+            self._release_files()
+        with self._cond:
+            self._exclusive = False
+            self._cond.notify_all()
+
+    def _release_files(self):
+        fcntl, layout, gate = self._lock_files()
+        fcntl.flock(layout, fcntl.LOCK_UN)
+        fcntl.flock(gate, fcntl.LOCK_UN)
+
+    def _read_epoch(self):
+        if not self.path:
+            return self._epoch
+        return int(os.pread(self._lock_files()[1], 20, 0).strip() or 0)
+
+    def epoch(self):
+        """Number of times rows were renumbered, as of now."""
+        epoch = self._read_epoch()
+        with self._epoch_lock:
+            changed = epoch != self._seen_epoch
+            self._seen_epoch = epoch
+        if changed and self.on_renumbered is not None:
+            self.on_renumbered()
+        return epoch
+
+
+class OutingArchive:
+    """Local SQLite store for closed outings, partitioned by OutDate month.
+
+    Rows are kept in their sheet shape. Adding an outing that is already
+    archived replaces the stored copy, so a pass that fails after archiving
+    but before removing its rows from the live storage can simply run again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS archived_outings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                month TEXT NOT NULL,
+                StudentId TEXT NOT NULL,
+                OutDate TEXT NOT NULL,
+                InDate TEXT NOT NULL,
+                row TEXT NOT NULL,
+                archived_at REAL NOT NULL,
+                UNIQUE (StudentId, OutDate, InDate)
+            );
+            CREATE INDEX IF NOT EXISTS archived_student_month ON archived_outings (StudentId, month);
+            CREATE INDEX IF NOT EXISTS archived_month ON archived_outings (month);
+        """)
+        create_lease_table(conn, "archiver_lease")
+
+    def _conn(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def add(self, rows):
+        """Archive sheet-shaped rows in one transaction."""
+        now = time.time()
+        records = []
+        for row in rows:
+            outing = Outing.from_row(row)
+            record = outing.to_dict()
+            records.append((month_of(outing), outing.student_id.strip(), record["OutDate"], record["InDate"],
+                            json.dumps(row), now))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO archived_outings (month, StudentId, OutDate, InDate, row, archived_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", records)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def student_rows(self, student_id, since=None, until=None):
+        """Archived rows for a StudentId, oldest first; ``since``/``until`` are inclusive "YYYY-MM"."""
+        sql = "SELECT row FROM archived_outings WHERE StudentId = ?"
+        params = [str(student_id).strip()]
+        if since:
+            sql += " AND month >= ?"
+            params.append(since)
+        if until:
+            sql += " AND month <= ?"
+            params.append(until)
+        return [json.loads(record[0]) for record in self._conn().execute(sql + " ORDER BY id", params)]
+
+    def months(self):
+        """``[(month, count), ...]`` of the archive's partitions."""
+        return self._conn().execute(
+            "SELECT month, COUNT(*) FROM archived_outings GROUP BY month ORDER BY month").fetchall()
+
+    def rows(self):
+        """Every archived row, oldest first."""
+        for record in self._conn().execute("SELECT row FROM archived_outings ORDER BY id"):
+            yield json.loads(record[0])
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM archived_outings").fetchone()[0]
+
+    def state(self):
+        """Changes whenever outings are archived; ``(count, newest id)``."""
+        return tuple(self._conn().execute("SELECT COUNT(*), MAX(id) FROM archived_outings").fetchone())
+
+    def hold_lease(self, owner, seconds):
+        """True if ``owner`` is (still) the one archiver; takes or renews the lease for ``seconds``."""
+        return hold_lease(self._conn(), "archiver_lease", owner, seconds)
+
+
+class Archiver:
+    """Moves closed outings out of the live storage into an ``OutingArchive``.
+
+    Every ``interval`` seconds a background thread archives outings that
+    closed more than ``min_age_days`` ago (by InDate), at most
+    ``batch_size`` per pass, and then removes them from the storage. A row
+    that changed in between is left for the next pass.
+
+    Worker processes sharing the archive file elect one archiver through a
+    lease, renewed every pass, that another process takes over once it
+    lapses after ``lease_seconds`` (twice the interval by default).
+    """
+
+    def __init__(self, storage, archive, layout_lock, min_age_days=7, interval=3600.0,
+                 batch_size=500, today=None, lease_seconds=None):
+        self.storage = storage
+        self.archive = archive
+        self.layout_lock = layout_lock
+        self.min_age_days = min_age_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds or 2 * interval
+        self._today = today or (lambda: datetime.today().date())
+        self._stop = threading.Event()
+        self._start = OncePerProcess(start_daemon, self._run, "outing-archiver")
+        self.archived = 0
+
+    def start(self):
+        # Once per process, so workers forked after import can take over
+        if self.interval > 0:
+            self._start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self.archive.hold_lease(str(os.getpid()), self.lease_seconds):
+                    self.run_once()
+            except Exception:
+                log.exception("archive pass failed")
+
+    def _candidates(self):
+        cutoff = self._today() - timedelta(days=self.min_age_days)
+        for row_id, row in self.storage.outings():
+            outing = Outing.from_row(row)
+            if is_closed(outing) and isinstance(outing.in_date, date) and outing.in_date < cutoff:
+                yield row_id, row
+
+    def run_once(self):
+        """Archive one batch of closed outings; returns how many were removed."""
+        removed = 0
+        self.layout_lock.acquire_exclusive()
+        try:
+            self.storage.refresh()
+            batch = []
+            for row_id, row in self._candidates():
+                _, version = self.storage.get_outing(row_id)
+                batch.append((row_id, row, version))
+                if len(batch) == self.batch_size:
+                    break
+            if not batch:
+                return 0
+            self.archive.add([row for _, row, _ in batch])
+            removed = self.storage.remove_outings([(row_id, version) for row_id, _, version in batch])
+        finally:
+            self.layout_lock.release_exclusive(renumbered=removed > 0)
+        self.archived += removed
+        log.info("archived closed outings", extra={"removed": removed, "candidates": len(batch)})
+        return removed
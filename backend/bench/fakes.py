@@ -0,0 +1,157 @@
+import collections
+import re
+import threading
+import time
+
+_CELL = re.compile(r"([A-Z]*)(\d*)")
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _parse_range(a1_range):
+    # "Sheet1!A2:V" -> ("Sheet1", first_col, first_row, last_col, last_row);
+    # open ends are None
+    sheet, _, cells = a1_range.rpartition('!')
+    start, _, end = cells.partition(':')
+    bounds = []
+    for cell in (start, end or start):
+        letters, digits = _CELL.fullmatch(cell).groups()
+        bounds.append((_column_index(letters) if letters else None, int(digits) if digits else None))
+    return sheet or "Sheet1", bounds[0][0], bounds[0][1], bounds[1][0], bounds[1][1]
+
+
+class _Request:
+    def __init__(self, sheets, method, run):
+        self._sheets = sheets
+        self._method = method
+        self._run = run
+
+    def execute(self, **kwargs):
+        self._sheets.record(self._method)
+        if self._sheets.latency:
+            time.sleep(self._sheets.latency)
+        with self._sheets.lock:
+            return self._run()
+
+
+class _Values:
+    def __init__(self, sheets):
+        self._sheets = sheets
+
+    def get(self, spreadsheetId, range, **kwargs):
+        return _Request(self._sheets, "values.get", lambda: self._sheets.read(spreadsheetId, range))
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        return _Request(self._sheets, "values.batchGet", lambda: {
+            "spreadsheetId": spreadsheetId,
+            "valueRanges": [self._sheets.read(spreadsheetId, r) for r in ranges],
+        })
+
+    def update(self, spreadsheetId, range, valueInputOption, body, includeValuesInResponse=False, **kwargs):
+        return _Request(self._sheets, "values.update", lambda: self._sheets.write(
+            spreadsheetId, range, body["values"], includeValuesInResponse))
+
+    def batchUpdate(self, spreadsheetId, body):
+        include = body.get("includeValuesInResponse", False)
+        return _Request(self._sheets, "values.batchUpdate", lambda: {
+            "spreadsheetId": spreadsheetId,
+            "responses": [self._sheets.write(spreadsheetId, d["range"], d["values"], include)
+                          for d in body["data"]],
+        })
+
+    def append(self, spreadsheetId, range, valueInputOption, body, includeValuesInResponse=False, **kwargs):
+        def run():
+            sheet = range.rpartition('!')[0] or "Sheet1"
+            grid = self._sheets.grid(spreadsheetId, sheet)
+            row_number = len(grid) + 1
+            last = chr(ord('A') + len(body["values"][0]) - 1)
+            target = f"{sheet}!A{row_number}:{last}{row_number + len(body['values']) - 1}"
+            return {"spreadsheetId": spreadsheetId,
+                    "updates": self._sheets.write(spreadsheetId, target, body["values"], includeValuesInResponse)}
+        return _Request(self._sheets, "values.append", run)
+
+
+class FakeSheetsService:
+    """In-process stand-in for the Sheets v4 ``spreadsheets().values()`` API.
+
+    Grids live in memory as lists of string rows keyed by (spreadsheet id,
+    tab name); row 1 is the header. Every executed call is counted per
+    method and per ``route`` (set by the caller on the current thread), and
+    can be delayed by ``latency`` seconds to imitate a network round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.grids = {}
+        self.calls = collections.Counter()
+        self._local = threading.local()
+
+    @property
+    def route(self):
+        return getattr(self._local, 'route', "(background)")
+
+    @route.setter
+    def route(self, value):
+        self._local.route = value
+
+    def record(self, method):
+        with self.lock:
+            self.calls[(self.route, method)] += 1
+
+    def load(self, spreadsheet_id, rows, sheet="Sheet1"):
+        self.grids[(spreadsheet_id, sheet)] = [list(row) for row in rows]
+
+    def grid(self, spreadsheet_id, sheet):
+        return self.grids.setdefault((spreadsheet_id, sheet), [])
+
+    def read(self, spreadsheet_id, a1_range):
+        sheet, first_col, first_row, last_col, last_row = _parse_range(a1_range)
+        grid = self.grid(spreadsheet_id, sheet)
+        first_row = first_row or 1
+        last_row = min(last_row or len(grid), len(grid))
+        first_col = first_col or 0
+        values = []
+        for row in grid[first_row - 1:last_row]:
+            cells = row[first_col:None if last_col is None else last_col + 1]
+            # The real API drops trailing empty cells and rows
+            while cells and cells[-1] == "":
+                cells = cells[:-1]
+            values.append(list(cells))
+        while values and not values[-1]:
+            values.pop()
+        result = {"range": a1_range, "majorDimension": "ROWS"}
+        if values:
+            result["values"] = values
+        return result
+
+    def write(self, spreadsheet_id, a1_range, values, include_values=False):
+        sheet, first_col, first_row, _, _ = _parse_range(a1_range)
+        grid = self.grid(spreadsheet_id, sheet)
+        first_col = first_col or 0
+        for offset, new_values in enumerate(values):
+            row_number = first_row + offset
+            while len(grid) < row_number:
+                grid.append([])
+            row = grid[row_number - 1]
+            for i, value in enumerate(new_values):
+                column = first_col + i
+                if len(row) <= column:
+                    row.extend([""] * (column + 1 - len(row)))
+                row[column] = "" if value is None else str(value)
+        result = {"spreadsheetId": spreadsheet_id, "updatedRange": a1_range,
+                  "updatedRows": len(values), "updatedCells": sum(len(v) for v in values)}
+        if include_values:
+            result["updatedData"] = self.read(spreadsheet_id, a1_range)
+        return result
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return _Values(self)
@@ -0,0 +1,63 @@
+import random
+from datetime import date, timedelta
+
+FIRST_NAMES = ["Aarav", "Diya", "Ishaan", "Kavya", "Rohan", "Sneha", "Arjun", "Meera", "Vivaan", "Ananya"]
+LAST_NAMES = ["Sharma", "Patel", "Iyer", "Reddy", "Nair", "Gupta", "Joshi", "Kulkarni", "Das", "Singh"]
+HOSTELS = ["Aravali", "Nilgiri", "Shivalik", "Satpura", "Vindhya", "Himadri"]
+COURSES = ["BTech", "MTech", "BSc", "MSc", "PhD"]
+REASONS = ["Home visit", "Medical", "Family function", "Shopping", "Interview"]
+
+
+def fmt(day):
+    return day.strftime("%d-%m-%Y")
+
+
+def student_rows(count, seed=0):
+    """Rows for the student sheet (A:K), without the header."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        rows.append([
+            f"S{i:06d}",
+            f"F{i:06d}",
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            f"9{rng.randrange(10 ** 9):09d}",
+            f"s{i:06d}@example.edu",
+            rng.choice(["M", "F"]),
+            rng.choice(HOSTELS),
+            str(rng.randrange(100, 500)),
+            str(rng.choice([2021, 2022, 2023, 2024])),
+            rng.choice(COURSES),
+            rng.choice(["NEET", "JEE"]),
+        ])
+    return rows
+
+
+def warden_rows(students, count, today=None, seed=0):
+    """Rows for the warden sheet (A:V): a year of closed outings and a few open ones."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    rows = []
+    for i in range(count):
+        student = rng.choice(students)
+        details = student[:4] + student[5:11]
+        out_day = today - timedelta(days=rng.randrange(1, 365))
+        in_day = out_day + timedelta(days=rng.randrange(1, 5))
+        closed = rng.random() < 0.97 and in_day < today
+        row = details + [rng.choice(REASONS), fmt(out_day)]
+        if closed:
+            row += ["IN", "APPROVED", "Warden", "ok", "09:00", fmt(in_day), "APPROVED", "Warden", "ok", "18:30"]
+        else:
+            row += ["OUT", "APPROVED", "Warden", "ok", "09:00"]
+        rows.append(row)
+    rows.sort(key=lambda row: row[11][6:] + row[11][3:5] + row[11][:2])
+    return rows
+
+
+def student_details(row):
+    """The ``studentDetails`` payload the front end sends for a student-sheet row."""
+    return {
+        "StudentId": row[0], "FaceId": row[1], "Name": row[2], "MobileNumber": row[3],
+        "Gender": row[5], "HostelName": row[6], "RoomNo": row[7], "Batch": row[8],
+        "Course": row[9], "NEET_JEE": row[10],
+    }
@@ -0,0 +1,242 @@
+"""Replay a synthetic day of outings against the Flask routes.
+
+Run from the backend directory:
+
+    python -m bench.replay --rows 10000 --students 2000 --threads 8
+
+Google Sheets is replaced by ``bench.fakes.FakeSheetsService`` and Twilio
+by ``outbox.FakeSmsClient``, so nothing leaves the machine. The report lists
+p50/p95/p99 latency, throughput and upstream Sheets calls per route;
+``--json`` also writes it to a file so runs can be compared for regressions.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from bench.fakes import FakeSheetsService
+from bench.generate import fmt, student_details, student_rows, warden_rows
+
+
+def load_app(sheets, workdir, storage_backend):
+    # app.py builds its Sheets and Twilio clients at import time; point both
+    # at local fakes before importing it.
+    os.environ["SMS_BACKEND"] = "fake"
+    os.environ["SMS_OUTBOX_DB"] = os.path.join(workdir, "sms_outbox.sqlite3")
+    os.environ["STORAGE_BACKEND"] = storage_backend
+    os.environ["STORAGE_SQLITE_PATH"] = os.path.join(workdir, "hostel.sqlite3")
+    os.environ["STORAGE_SEED_FROM_SHEETS"] = "1"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Measure the app, not the quota limiter
+    os.environ.setdefault("SHEETS_READS_PER_MINUTE", "0")
+    os.environ.setdefault("SHEETS_WRITES_PER_MINUTE", "0")
+    os.environ["ARCHIVE_DB"] = os.path.join(workdir, "outing_archive.sqlite3")
+    os.environ.setdefault("ARCHIVE_INTERVAL", "0")
+    os.environ["GATE_JOURNAL_DB"] = os.path.join(workdir, "gate_journal.sqlite3")
+    os.environ["CURFEW_DB"] = os.path.join(workdir, "curfew_alerts.sqlite3")
+    os.environ["ROW_LAYOUT_LOCK"] = os.path.join(workdir, "row_layout.lock")
+
+    import googleapiclient.discovery
+    from google.oauth2 import service_account
+    googleapiclient.discovery.build_from_document = lambda *args, **kwargs: sheets
+    service_account.Credentials.from_service_account_file = lambda *args, **kwargs: None
+
+    import app
+    return app
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def build_phases(students, args, rng):
+    """Return a list of phases; each phase is a list of (route, method, path, payload)."""
+    today = date.today()
+    out_date = fmt(today + timedelta(days=1))
+    in_date = fmt(today + timedelta(days=2))
+    active = rng.sample(students, min(args.active, len(students)))
+
+    def polls(path, count):
+        return [(path, "get", path, None)] * count
+
+    phases = []
+
+    # Students look themselves up and ask to go out
+    ops = []
+    for row in active:
+        ops.append(("/fetch_student", "post", "/fetch_student", {"StudentId": row[0]}))
+        ops.append(("/fetch_student_requests", "post", "/fetch_student_requests", {"StudentId": row[0]}))
+        ops.append(("/submit_out_request", "post", "/submit_out_request", {
+            "studentDetails": student_details(row),
+            "leaveRequest": {"reason": "Home visit", "outDate": out_date},
+        }))
+    phases.append(ops)
+
+    # Warden clears the out queue while dashboards refresh
+    ops = polls("/warden/out_request_dashboard", len(active) * args.polls)
+    for row in active:
+        ops.append(("/warden/update_out_status", "post", "/warden/update_out_status", {
+            "StudentId": row[0], "OutDate": out_date, "ApprovalStatus": "APPROVED",
+            "WardenName": "Warden", "Remarks": "ok",
+        }))
+    phases.append(ops)
+
+    # Guards scan students out
+    ops = polls("/guard/out_dashboard", len(active) * args.polls)
+    for row in active:
+        ops.append(("/guard/search", "post", "/guard/search", {"StudentId": row[0]}))
+        ops.append(("/guard/update_out_status", "post", "/guard/update_out_status", {
+            "StudentId": row[0], "Status": "OUT", "Time": "09:00",
+        }))
+    phases.append(ops)
+
+    # Students ask to return, the warden approves, guards scan them in
+    phases.append([("/submit_in_request", "post", "/submit_in_request", {
+        "studentDetails": student_details(row), "leaveRequest": {"inDate": in_date},
+    }) for row in active])
+    ops = polls("/warden/in_request_dashboard", len(active) * args.polls)
+    for row in active:
+        ops.append(("/warden/update_in_status", "post", "/warden/update_in_status", {
+            "StudentId": row[0], "InDate": in_date, "ApprovalStatus": "APPROVED",
+            "WardenName": "Warden", "Remarks": "ok",
+        }))
+    phases.append(ops)
+    ops = polls("/guard/in_dashboard", len(active) * args.polls)
+    for row in active:
+        ops.append(("/guard/update_in_status", "post", "/guard/update_in_status", {
+            "StudentId": row[0], "Status": "IN", "Time": "18:30",
+        }))
+    phases.append(ops)
+
+    for ops in phases:
+        rng.shuffle(ops)
+    return phases
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    sheets = FakeSheetsService(latency=args.latency_ms / 1000.0)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    app = load_app(sheets, workdir, args.storage)
+
+    # Let the background warm-up finish against the empty sheets first, then
+    # fill them and drop what it cached
+    app.warm_up.wait(30)
+    students = student_rows(args.students, seed=args.seed)
+    sheets.load(app.STUDENT_SHEET_ID, [["StudentId"] * 11] + students)
+    sheets.load(app.WARDEN_SHEET_ID, [["StudentId"] * 22] + warden_rows(students, args.rows, seed=args.seed))
+    if args.storage == "sqlite":
+        # Seeding reads the sheets once; rebuild storage now that they exist
+        app.storage = app.build_storage()
+        app.views = app.DashboardViews(app.storage)
+        app.search_index = app.OutingSearchIndex(app.storage)
+        app.gate_journal.storage = app.storage
+    else:
+        app.storage.rows.invalidate()
+        app.storage.students.refresh()
+    sheets.calls.clear()
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    clients = {}
+    etags = defaultdict(dict)
+
+    def execute(op):
+        route, method, path, payload = op
+        client = clients.setdefault(threading.get_ident(), app.app.test_client())
+        # Each client revalidates its last dashboard copy, as browsers do
+        cached = etags[threading.get_ident()]
+        headers = {"If-None-Match": cached[path]} if path in cached else {}
+        sheets.route = route
+        started = time.perf_counter()
+        if method == "get":
+            response = client.get(path, headers=headers)
+        else:
+            response = client.post(path, json=payload)
+        elapsed = time.perf_counter() - started
+        if response.headers.get("ETag"):
+            cached[path] = response.headers["ETag"]
+        sheets.route = "(background)"
+        return route, elapsed, response.status_code
+
+    phases = build_phases(students, args, rng)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for ops in phases:
+            for route, elapsed, status in pool.map(execute, ops):
+                latencies[route].append(elapsed)
+                statuses[route][status] += 1
+            # Scans are replicated in the background; let them land before the next phase
+            app.gate_journal.drain(timeout=30)
+    wall = time.perf_counter() - started
+    app.outbox.drain(timeout=30)
+
+    upstream = defaultdict(dict)
+    for (route, method), count in sheets.calls.items():
+        upstream[route][method] = count
+
+    report = {"config": vars(args), "wall_seconds": wall, "routes": {},
+              "sms_sent": len(app.client.messages.sent), "upstream": upstream}
+    total = 0
+    for route, values in sorted(latencies.items()):
+        values.sort()
+        total += len(values)
+        calls = sum(upstream.get(route, {}).values())
+        report["routes"][route] = {
+            "requests": len(values),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "upstream_calls": upstream.get(route, {}),
+            "upstream_per_request": calls / len(values),
+            "statuses": dict(statuses[route]),
+        }
+    report["requests"] = total
+    report["throughput_rps"] = total / wall if wall else 0.0
+    return report
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['wall_seconds']:.2f}s "
+          f"({report['throughput_rps']:.1f} req/s), {report['sms_sent']} SMS sent")
+    print(f"{'route':34} {'n':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'up/req':>7}  statuses")
+    for route, stats in report["routes"].items():
+        print(f"{route:34} {stats['requests']:6d} {stats['p50_ms']:8.2f} {stats['p95_ms']:8.2f} "
+              f"{stats['p99_ms']:8.2f} {stats['upstream_per_request']:7.2f}  {stats['statuses']}")
+    print("upstream Sheets calls:")
+    for route, methods in sorted(report["upstream"].items()):
+        print(f"  {route:32} {methods}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000, help="historical rows in the warden sheet")
+    parser.add_argument("--students", type=int, default=1000, help="rows in the student sheet")
+    parser.add_argument("--active", type=int, default=200, help="students going out during the replay")
+    parser.add_argument("--polls", type=int, default=5, help="dashboard polls per write")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated Sheets round trip")
+    parser.add_argument("--storage", choices=["sheets", "sqlite"], default="sheets")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import contextlib
+import heapq
+import logging
+import sqlite3
+import threading
+import time as clock
+from datetime import date, datetime, time
+
+from outing import Approval, Outing
+from workers import OncePerProcess, start_daemon
+
+log = logging.getLogger(__name__)
+
+
+def return_deadline(outing, curfew):
+    """When the student must be back, or None if they are not out or have no InDate.
+
+    A student is out once the outing was approved and the gate recorded an
+    OutTime, until an InTime is recorded; they are due at ``curfew`` on
+    their InDate.
+    """
+    if (outing.out_approval is Approval.APPROVED and outing.out_time.strip()
+            and not outing.in_time.strip() and isinstance(outing.in_date, date)):
+        return datetime.combine(outing.in_date, curfew)
+    return None
+
+
+class CurfewWatch:
+    """Alerts once when a student is not back by curfew on their InDate.
+
+    Registered as a storage listener: every outing with a deadline (see
+    ``return_deadline``) sits in a heap ordered by it, and ``row_changed``
+    or ``reset`` update the heap as rows change. Superseded heap entries
+    are skipped when they surface. A background thread sleeps until the
+    earliest deadline, so nothing is scanned between deadlines; it also
+    wakes every ``refresh_interval`` seconds to pick up changes made by
+    other processes.
+
+    When deadlines pass, the due outings are re-checked and handed to
+    ``alert([outing, ...])`` in one batch. Each outing is claimed in the
+    SQLite file at ``path`` first, so it is alerted once even across
+    restarts and worker processes.
+    """
+
+    def __init__(self, storage, path, alert, curfew=time(21, 0), refresh_interval=300.0, now=None):
+        self.storage = storage
+        self.path = path
+        self.alert = alert
+        self.curfew = curfew
+        self.refresh_interval = refresh_interval
+        self._now = now or datetime.now
+        self._cond = threading.Condition()
+        self._deadlines = {}
+        self._heap = []
+        self._start = OncePerProcess(start_daemon, self._run, "curfew-watch")
+        self.alerted = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS curfew_alerts (
+                    StudentId TEXT NOT NULL,
+                    OutDate TEXT NOT NULL,
+                    InDate TEXT NOT NULL,
+                    alerted_at REAL NOT NULL,
+                    PRIMARY KEY (StudentId, OutDate, InDate)
+                )""")
+        storage.add_listener(self)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def reset(self, outings):
+        with self._cond:
+            self._deadlines = {}
+            for row_id, row in outings():
+                deadline = return_deadline(Outing.from_row(row), self.curfew)
+                if deadline is not None:
+                    self._deadlines[row_id] = deadline
+            self._heap = [(deadline, row_id) for row_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify_all()
+
+    def row_changed(self, row_id, row):
+        deadline = return_deadline(Outing.from_row(row), self.curfew)
+        with self._cond:
+            if self._deadlines.get(row_id) == deadline:
+                return
+            if deadline is None:
+                del self._deadlines[row_id]
+                return
+            earliest = self._next_deadline()
+            self._deadlines[row_id] = deadline
+            heapq.heappush(self._heap, (deadline, row_id))
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                # Mostly superseded entries; start over from the live ones
+                self._heap = [(deadline, row_id) for row_id, deadline in self._deadlines.items()]
+                heapq.heapify(self._heap)
+            if earliest is None or deadline < earliest:
+                self._cond.notify_all()  # The watcher sleeps until a later deadline
+
+    def _next_deadline(self):
+        # Called with the condition held; drops superseded entries on the way
+        while self._heap:
+            deadline, row_id = self._heap[0]
+            if self._deadlines.get(row_id) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def start(self):
+        # Once per process, so workers forked after import watch too
+        self._start()
+
+    def _run(self):
+        while True:
+            retry = 0.0
+            try:
+                self.storage.refresh()
+                self.run_once()
+            except Exception:
+                log.exception("curfew check failed")
+                retry = min(30.0, self.refresh_interval)
+            with self._cond:
+                deadline = self._next_deadline()
+                wait = self.refresh_interval
+                if deadline is not None:
+                    wait = min(wait, max(retry, (deadline - self._now()).total_seconds()))
+                if wait > 0:
+                    self._cond.wait(wait)
+
+    def run_once(self):
+        """Alert about every outing whose deadline has passed; returns how many were alerted."""
+        now = self._now()
+        due = []
+        with self._cond:
+            while True:
+                deadline = self._next_deadline()
+                if deadline is None or deadline > now:
+                    break
+                due.append(heapq.heappop(self._heap))
+                del self._deadlines[due[-1][1]]
+        if not due:
+            return 0
+
+        try:
+            outings = []
+            for _, row_id in due:
+                row, _ = self.storage.get_outing(row_id)
+                outing = Outing.from_row(row) if row is not None else None
+                deadline = return_deadline(outing, self.curfew) if outing is not None else None
+                if deadline is not None and deadline <= now:
+                    outings.append(outing)
+            claimed = self._claim(outings)
+        except Exception:
+            # Put them back for the next check, unless the rows changed meanwhile
+            with self._cond:
+                for deadline, row_id in due:
+                    if row_id not in self._deadlines:
+                        self._deadlines[row_id] = deadline
+                        heapq.heappush(self._heap, (deadline, row_id))
+            raise
+        if claimed:
+            self.alert(claimed)
+            self.alerted += len(claimed)
+            log.warning("students not back by curfew", extra={
+                "count": len(claimed), "student_ids": [outing.student_id for outing in claimed]})
+        return len(claimed)
+
+    def _claim(self, outings):
+        # Outings not alerted about before, recorded as alerted now
+        claimed = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for outing in outings:
+                record = outing.to_dict()
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO curfew_alerts (StudentId, OutDate, InDate, alerted_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (outing.student_id.strip(), record["OutDate"], record["InDate"], clock.time()))
+                if cursor.rowcount:
+                    claimed.append(outing)
+            conn.execute("COMMIT")
+        return claimed
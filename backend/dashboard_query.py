@@ -0,0 +1,120 @@
+from datetime import date, datetime
+
+MAX_LIMIT = 500
+
+
+def parse_date(value):
+    # Dashboards accept the sheet's dd-mm-yyyy as well as ISO yyyy-mm-dd
+    for fmt in ("%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date: {value}")
+
+
+class DashboardQuery:
+    """Pagination, filters and field selection for a dashboard request.
+
+    Built from the query string:
+
+    - ``limit`` / ``cursor``: page size and the opaque cursor returned in
+      the ``X-Next-Cursor`` header of the previous page. Cursors name the
+      row-layout epoch they were issued in; one issued before archiving
+      renumbered the rows is rejected, and the client starts over.
+    - ``hostel``: HostelName, case-insensitive
+    - ``from`` / ``to``: inclusive range on the dashboard's date column
+      (OutDate or InDate)
+    - ``status``: the dashboard's warden approval (e.g. APPROVED, REJECTED)
+    - ``fields``: comma-separated keys to keep in each record
+
+    With no parameters every matching record is returned, as before.
+    """
+
+    def __init__(self, limit=None, cursor=None, hostel=None, date_from=None, date_to=None,
+                 status=None, fields=None, epoch=0):
+        self.limit = limit
+        self.cursor = cursor
+        self.epoch = epoch
+        self.hostel = hostel
+        self.date_from = date_from
+        self.date_to = date_to
+        self.status = status
+        self.fields = fields
+
+    @classmethod
+    def from_args(cls, args, epoch=0):
+        """Parse ``request.args``; raises ValueError on malformed values or a stale cursor.
+
+        ``epoch`` is the current row-layout epoch (see ``SharedLock.epoch``).
+        """
+        limit = args.get('limit')
+        if limit is not None:
+            limit = int(limit)
+            if not 1 <= limit <= MAX_LIMIT:
+                raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        cursor = args.get('cursor')
+        if cursor is not None:
+            # "<epoch>.<row id>"; a bare row id is from epoch 0
+            cursor_epoch, _, cursor = cursor.rpartition('.')
+            if int(cursor_epoch or 0) != epoch:
+                raise ValueError("cursor expired: rows were archived since, start again from the first page")
+            cursor = int(cursor)
+        date_from = parse_date(args['from']) if args.get('from') else None
+        date_to = parse_date(args['to']) if args.get('to') else None
+        fields = args.get('fields')
+        if fields:
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+        return cls(
+            limit=limit,
+            cursor=cursor,
+            hostel=(args.get('hostel') or '').strip().lower() or None,
+            date_from=date_from,
+            date_to=date_to,
+            status=(args.get('status') or '').strip().upper() or None,
+            fields=fields or None,
+            epoch=epoch,
+        )
+
+    def matches(self, outing, date_field, approval_field):
+        if self.hostel is not None:
+            if outing.hostel_name.strip().lower() != self.hostel:
+                return False
+        if self.status is not None:
+            if getattr(outing, approval_field).strip().upper() != self.status:
+                return False
+        if self.date_from is not None or self.date_to is not None:
+            day = getattr(outing, date_field)
+            if not isinstance(day, date):
+                try:
+                    day = parse_date(day) if day else None
+                except ValueError:
+                    day = None
+            if day is None:
+                return False
+            if self.date_from is not None and day < self.date_from:
+                return False
+            if self.date_to is not None and day > self.date_to:
+                return False
+        return True
+
+    def page(self, outings, date_field, approval_field):
+        """Filter and page ``[(row_id, outing), ...]`` given in row order.
+
+        Returns ``(page, next_cursor)``; ``next_cursor`` is None on the last page.
+        """
+        selected = []
+        for row_id, outing in outings:
+            if self.cursor is not None and row_id <= self.cursor:
+                continue
+            if not self.matches(outing, date_field, approval_field):
+                continue
+            if self.limit is not None and len(selected) == self.limit:
+                return selected, f"{self.epoch}.{selected[-1][0]}"
+            selected.append((row_id, outing))
+        return selected, None
+
+    def project(self, records):
+        if not self.fields:
+            return records
+        return [{field: record[field] for field in self.fields if field in record} for record in records]
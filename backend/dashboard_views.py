@@ -0,0 +1,188 @@
+import collections
+import threading
+import time
+from datetime import date, datetime
+
+from outing import Approval, Outing, Status
+
+DECIDED = (Approval.APPROVED, Approval.REJECTED)
+
+
+# Each view decides membership for one outing. Date-bound views return the
+# outing's date (kept so the view can be rolled forward), the others True;
+# None keeps the outing out.
+
+def _dated(value):
+    return value if isinstance(value, date) else None
+
+
+def _warden_out(outing):
+    if outing.status is Status.OUT and outing.out_approval is Approval.PENDING:
+        return _dated(outing.out_date)
+    return None
+
+
+def _warden_in(outing):
+    if outing.status is Status.IN and outing.in_approval is Approval.PENDING:
+        return _dated(outing.in_date)
+    return None
+
+
+def _guard_out(outing):
+    return True if outing.status is Status.OUT and outing.out_approval in DECIDED else None
+
+
+def _guard_in(outing):
+    return True if outing.status is Status.IN and outing.in_approval in DECIDED else None
+
+
+VIEWS = {
+    "warden_out": _warden_out,
+    "warden_in": _warden_in,
+    "guard_out": _guard_out,
+    "guard_in": _guard_in,
+}
+DATED_VIEWS = ("warden_out", "warden_in")
+
+
+class DashboardViews:
+    """The four dashboard result sets, kept current as outings change.
+
+    Registered as a storage listener: ``row_changed`` moves a single row in
+    or out of each view and ``reset`` rebuilds them after the storage
+    reloads. The warden views only hold requests dated today or later;
+    members that fall behind are dropped when the date changes.
+
+    Rows are parsed into ``Outing`` records once, as they arrive; views
+    hand out ``[(row_id, outing), ...]`` in row order.
+
+    Every change to a view bumps its version and is appended to a short
+    change log, numbered by ``seq``, that ``wait_for_changes`` serves to
+    push clients. A reload that turns out to change nothing leaves both
+    alone.
+    """
+
+    def __init__(self, storage, today=None, log_size=1000):
+        self.storage = storage
+        self._today = today or (lambda: datetime.today().date())
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._members = {name: {} for name in VIEWS}
+        self._ordered = {}
+        self._versions = {name: 0 for name in VIEWS}
+        self._log = collections.deque(maxlen=log_size)
+        self._seq = 0
+        self._day = None
+        storage.add_listener(self)
+
+    def _record(self, name, action, row_id, outing=None):
+        # Called with the lock held
+        self._ordered.pop(name, None)
+        self._versions[name] += 1
+        self._seq += 1
+        self._log.append((self._seq, name, action, row_id, outing))
+        self._changed.notify_all()
+
+    def reset(self, outings):
+        # Rebuilt under the lock so no row_changed can slip in between the
+        # scan and the swap; only the differences are recorded
+        with self._lock:
+            old = self._members
+            self._day = self._today()
+            self._members = {name: {} for name in VIEWS}
+            for row_id, row in outings():
+                self._place(row_id, row)
+            for name in VIEWS:
+                new = self._members[name]
+                for row_id, (outing, _) in new.items():
+                    previous = old[name].get(row_id)
+                    if previous is None:
+                        self._record(name, "added", row_id, outing)
+                    elif previous[0] != outing:
+                        self._record(name, "updated", row_id, outing)
+                for row_id in old[name].keys() - new.keys():
+                    self._record(name, "removed", row_id)
+
+    def row_changed(self, row_id, row):
+        with self._lock:
+            before = {name: self._members[name].pop(row_id, None) for name in VIEWS}
+            outing = self._place(row_id, row)
+            for name in VIEWS:
+                was, now = before[name], self._members[name].get(row_id)
+                if was is not None and now is None:
+                    self._record(name, "removed", row_id)
+                elif now is not None:
+                    self._record(name, "added" if was is None else "updated", row_id, outing)
+
+    def _place(self, row_id, row):
+        # Called with the lock held
+        outing = Outing.from_row(row)
+        for name, member in VIEWS.items():
+            key = member(outing)
+            if key is None:
+                continue
+            if name in DATED_VIEWS and self._day is not None and key < self._day:
+                continue
+            self._members[name][row_id] = (outing, key)
+        return outing
+
+    def _roll_forward(self):
+        # Called with the lock held
+        today = self._today()
+        if today == self._day:
+            return
+        for name in DATED_VIEWS:
+            members = self._members[name]
+            expired = [row_id for row_id, (_, day) in members.items() if day < today]
+            for row_id in expired:
+                del members[row_id]
+                self._record(name, "removed", row_id)
+        self._day = today
+
+    def snapshot(self, name):
+        """Return ``(version, [(row_id, outing), ...])`` for a view, in row order."""
+        self.storage.refresh()
+        with self._lock:
+            self._roll_forward()
+            ordered = self._ordered.get(name)
+            if ordered is None:
+                ordered = [(row_id, outing) for row_id, (outing, _) in sorted(self._members[name].items())]
+                self._ordered[name] = ordered
+            return self._versions[name], ordered
+
+    def rows(self, name):
+        return self.snapshot(name)[1]
+
+    def version(self, name):
+        self.storage.refresh()
+        with self._lock:
+            self._roll_forward()
+            return self._versions[name]
+
+    def wait_for_changes(self, since, names=None, timeout=15.0, poll_interval=5.0):
+        """Block until the log has entries after ``since`` or ``timeout`` passes.
+
+        Returns ``(seq, changes)`` where ``changes`` is a list of
+        ``(seq, view, action, row_id, outing)`` for the requested views, or
+        ``(seq, None)`` if ``since`` has already dropped out of the log and
+        the client must refetch. ``since=None`` starts from now. The storage
+        is refreshed every ``poll_interval`` seconds so changes made by other
+        processes are noticed too.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.storage.refresh()
+            with self._lock:
+                self._roll_forward()
+                if since is None:
+                    since = self._seq
+                if since > self._seq or (self._log and since < self._log[0][0] - 1):
+                    return self._seq, None
+                changes = [entry for entry in self._log
+                           if entry[0] > since and (names is None or entry[1] in names)]
+                if changes:
+                    return changes[-1][0], changes
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return self._seq, []
+                self._changed.wait(min(remaining, poll_interval))
@@ -0,0 +1,245 @@
+import contextlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from sheet_cache import StaleRowError
+from storage import COLUMN
+from workers import OncePerProcess, create_lease_table, hold_lease, start_daemon
+
+log = logging.getLogger(__name__)
+
+TIME_COLUMN = {"OUT": COLUMN["OutTime"], "IN": COLUMN["InTime"]}
+
+
+def _cell(row, column):
+    return row[column].strip() if len(row) > column else ""
+
+
+def open_outing(outings, status):
+    """Row id of the outing a ``status`` scan belongs to, from ``[(row_id, row), ...]``.
+
+    An OUT scan goes to the newest approved outing with no OutTime, an IN
+    scan to the newest one with an OutTime and no InTime. Failing that, the
+    newest row without the scan's time, then the newest row.
+    """
+    if status == "OUT":
+        def is_open(row):
+            return (_cell(row, COLUMN["Warden_OutApproval"]).upper() == "APPROVED"
+                    and not _cell(row, COLUMN["OutTime"]))
+    else:
+        def is_open(row):
+            return bool(_cell(row, COLUMN["OutTime"])) and not _cell(row, COLUMN["InTime"])
+    column = TIME_COLUMN.get(status)
+    for matches in (is_open, lambda row: column is None or not _cell(row, column), lambda row: True):
+        for row_id, row in reversed(outings):
+            if matches(row):
+                return row_id
+
+
+class GateJournal:
+    """Append-only SQLite journal of guard scans, replicated to the storage in order.
+
+    ``record`` stores scans and returns at local-disk latency, so the gate
+    never waits on Google. A single replicator thread applies pending scans
+    in journal order, in batches of up to ``batch_size``, through
+    ``Storage.record_gate_events``; a failed batch is retried with jittered
+    exponential backoff and nothing later overtakes it.
+
+    - Each scan carries an ``event_id``; recording the same id twice (a
+      terminal resending after a timeout) keeps the first.
+    - A scan whose row already shows its Status and time is marked applied
+      without writing, so replaying after a crash between the write and
+      the bookkeeping changes nothing.
+    - A scan for a student with no outing is marked ``rejected``.
+
+    A scan updates the student's open outing (see ``open_outing``), so the
+    closed outings before it keep their times. Replication
+    holds ``layout_lock`` shared, as write requests do. Worker processes
+    sharing the journal file elect one replicator through a lease that
+    lapses after ``lease_seconds`` without renewal.
+    """
+
+    def __init__(self, path, storage, layout_lock=None, batch_size=100, backoff=1.0, max_backoff=60.0,
+                 lease_seconds=120.0):
+        self.path = path
+        self.storage = storage
+        self.layout_lock = layout_lock
+        self.batch_size = batch_size
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Condition()
+        self._start = OncePerProcess(start_daemon, self._replicate, "gate-journal")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS gate_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_id TEXT NOT NULL UNIQUE,
+                    student_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    error TEXT,
+                    recorded_at REAL NOT NULL,
+                    applied_at REAL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS gate_events_state ON gate_events (state, id)")
+            create_lease_table(conn, "replicator_lease")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A short-lived connection per operation, as in the SMS outbox
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def record(self, events):
+        """Journal ``[(event_id, student_id, status, time), ...]`` in one transaction.
+
+        ``event_id`` may be None to have one generated. Returns the event
+        ids in order, including ones that were already journaled.
+        """
+        now = time.time()
+        ids = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for event_id, student_id, status, scanned_at in events:
+                event_id = event_id or uuid.uuid4().hex
+                conn.execute(
+                    "INSERT OR IGNORE INTO gate_events (event_id, student_id, status, time, recorded_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (event_id, str(student_id).strip(), status, scanned_at or "", now))
+                ids.append(event_id)
+            conn.execute("COMMIT")
+        with self._wakeup:
+            self._wakeup.notify_all()
+        return ids
+
+    def event(self, event_id):
+        """Return ``{"state", "error", ...}`` for a journaled scan, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT event_id, student_id, status, time, state, error, recorded_at, applied_at "
+                "FROM gate_events WHERE event_id = ?", (event_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ("EventId", "StudentId", "Status", "Time", "state", "error", "recorded_at", "applied_at")
+        return dict(zip(keys, row))
+
+    def counts(self):
+        """Return ``{state: number_of_events}``."""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM gate_events GROUP BY state"))
+
+    def lag(self):
+        """Seconds the oldest pending scan has waited, 0 if none is pending."""
+        with self._connect() as conn:
+            oldest = conn.execute("SELECT MIN(recorded_at) FROM gate_events WHERE state = 'pending'").fetchone()[0]
+        return time.time() - oldest if oldest is not None else 0.0
+
+    def start(self):
+        # Once per process, so workers forked after import replicate too
+        self._start()
+
+    def _hold_lease(self):
+        # True if this process is (still) the replicator
+        with self._connect() as conn:
+            return hold_lease(conn, "replicator_lease", str(os.getpid()), self.lease_seconds)
+
+    def _pending(self):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT id, student_id, status, time FROM gate_events WHERE state = 'pending' "
+                "ORDER BY id LIMIT ?", (self.batch_size,)).fetchall()
+
+    def _replicate(self):
+        failures = 0
+        while True:
+            batch = []
+            try:
+                if not self._hold_lease():
+                    time.sleep(self.lease_seconds / 4)
+                    continue
+                batch = self._pending()
+                if not batch:
+                    with self._wakeup:
+                        self._wakeup.wait(timeout=5.0)
+                    continue
+                self.apply(batch)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (failures - 1)) * random.uniform(0.5, 1.5)
+                level = logging.INFO if isinstance(e, StaleRowError) else logging.WARNING
+                log.log(level, "gate event replication failed (attempt %d): %s", failures, e,
+                        extra={"events": len(batch), "retry_in": round(delay, 2)})
+                time.sleep(delay)
+
+    def apply(self, batch):
+        """Push ``[(id, student_id, status, time), ...]`` to the storage and mark them done."""
+        if self.layout_lock is not None:
+            self.layout_lock.acquire_shared()
+        try:
+            writes, settled, rejected = [], [], []
+            # Rows as they will read once this batch's earlier writes land,
+            # so an OUT and IN scan in one batch both find the same outing
+            written = {}
+            for journal_id, student_id, status, scanned_at in batch:
+                matches = [(row_id, written.get(row_id, row))
+                           for row_id, row in self.storage.student_outings(student_id)]
+                if not matches:
+                    rejected.append((journal_id, "Student not found"))
+                    continue
+                column = TIME_COLUMN.get(status)
+                if column is not None and any(
+                        _cell(row, COLUMN["Status"]) == status and _cell(row, column) == scanned_at
+                        for _, row in matches):
+                    settled.append(journal_id)
+                    continue
+                row_id = open_outing(matches, status)
+                version = self.storage.get_outing(row_id)[1]
+                row = list(dict(matches)[row_id])
+                row += [""] * (len(COLUMN) - len(row))
+                row[COLUMN["Status"]] = status
+                if column is not None:
+                    row[column] = scanned_at
+                written[row_id] = row
+                writes.append((journal_id, row_id, status, scanned_at, version))
+            if writes:
+                self.storage.record_gate_events([
+                    (row_id, status, scanned_at, version) for _, row_id, status, scanned_at, version in writes
+                ])
+        finally:
+            if self.layout_lock is not None:
+                self.layout_lock.release_shared()
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE gate_events SET state = 'applied', applied_at = ?, error = NULL WHERE id = ?",
+                [(now, journal_id) for journal_id in settled + [write[0] for write in writes]])
+            conn.executemany(
+                "UPDATE gate_events SET state = 'rejected', applied_at = ?, error = ? WHERE id = ?",
+                [(now, error, journal_id) for journal_id, error in rejected])
+            conn.execute("COMMIT")
+        if writes or rejected:
+            log.info("gate events replicated", extra={
+                "applied": len(writes), "already_applied": len(settled), "rejected": len(rejected)})
+
+    def drain(self, timeout=10.0):
+        """Wait until no scan is pending; True if it got there in time."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.counts().get('pending'):
+                return True
+            time.sleep(0.05)
+        return False
@@ -0,0 +1,209 @@
+import bisect
+import contextlib
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+# Seconds; tuned for Sheets round trips (tens to hundreds of milliseconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 5000, 10000, 50000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(zip(self.labelnames, key))} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(labels + [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(labels + [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {_number(values[-2])}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {values[-1]}")
+        return lines
+
+
+class Collected:
+    """A metric read when rendering: ``collect`` returns ``[(labels_dict, value), ...]``."""
+
+    def __init__(self, name, help, collect, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_label_text(sorted(labels.items()))} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time spent handling a request.", ("route", "method")))
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "Requests handled, by response status.", ("route", "method", "status")))
+HTTP_ERRORS = REGISTRY.register(Counter(
+    "http_request_errors_total", "Requests that ended in a 5xx response.", ("route",)))
+HTTP_ROWS = REGISTRY.register(Histogram(
+    "http_request_rows_scanned", "Outing rows a request looked at.", ("route",), buckets=ROW_BUCKETS))
+UPSTREAM_LATENCY = REGISTRY.register(Histogram(
+    "upstream_call_duration_seconds", "Time spent in Sheets and Twilio calls.", ("service", "method")))
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    "upstream_call_errors_total", "Sheets and Twilio calls that raised.", ("service", "method")))
+
+
+@contextlib.contextmanager
+def upstream_call(service, method):
+    """Time one upstream call and count it as an error if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(service=service, method=method)
+        raise
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - started, service=service, method=method)
+
+
+def count_rows(count):
+    """Add ``count`` to the rows scanned by the current request."""
+    if has_request_context():
+        g.rows_scanned = g.get("rows_scanned", 0) + count
+
+
+class TracedSheets:
+    """Wraps a Sheets API client so every ``execute()`` is timed.
+
+    The method label is the call chain below ``spreadsheets()``, e.g.
+    ``values.get`` or ``values.batchUpdate``.
+    """
+
+    def __init__(self, target, method=""):
+        self._target = target
+        self._method = method
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name == "execute":
+            def execute(*args, **kwargs):
+                with upstream_call("sheets", self._method or "execute"):
+                    return attr(*args, **kwargs)
+            return execute
+        if not callable(attr):
+            return attr
+        method = self._method if name == "spreadsheets" else (f"{self._method}.{name}" if self._method else name)
+
+        def call(*args, **kwargs):
+            return TracedSheets(attr(*args, **kwargs), method)
+        return call
+
+
+def init_request_metrics(app):
+    """Record latency, status and rows scanned for every request."""
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("metrics_started")
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else "(unmatched)"
+        HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        if response.status_code >= 500:
+            HTTP_ERRORS.inc(route=route)
+        if "rows_scanned" in g:
+            HTTP_ROWS.observe(g.rows_scanned, route=route)
+        return response
@@ -0,0 +1,212 @@
+import contextlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from workers import OncePerProcess, start_daemon
+
+log = logging.getLogger(__name__)
+
+
+class FakeSmsClient:
+    """Stand-in for ``twilio.rest.Client`` that records messages locally.
+
+    It exposes the same ``client.messages.create(body=, from_=, to=)`` call,
+    so it can replace the Twilio client in tests and offline runs.
+    """
+
+    class _Message:
+        def __init__(self, sid, body, from_, to):
+            self.sid = sid
+            self.body = body
+            self.from_ = from_
+            self.to = to
+
+    class _Messages:
+        def __init__(self):
+            self.sent = []
+            self._lock = threading.Lock()
+
+        def create(self, body, from_, to):
+            with self._lock:
+                message = FakeSmsClient._Message(f"FAKE{len(self.sent) + 1}", body, from_, to)
+                self.sent.append(message)
+            return message
+
+    def __init__(self):
+        self.messages = self._Messages()
+
+
+class SmsOutbox:
+    """Durable SQLite outbox for SMS, drained by a pool of worker threads.
+
+    ``enqueue`` stores a message and returns at local-disk latency. Workers
+    call ``send(to, body)`` (which returns the provider's message SID) and
+    retry failures with jittered exponential backoff until ``max_attempts``.
+
+    A worker claims a message by marking it ``sending`` with its owner and
+    the time. Worker processes sharing the file leave each other's claims
+    alone; only a claim older than ``claim_timeout`` seconds, left by a
+    process that died mid-send, goes back to ``pending``. Delivery is
+    therefore at-least-once.
+    """
+
+    def __init__(self, path, send, workers=2, max_attempts=5, backoff=2.0, max_backoff=300.0,
+                 claim_timeout=300.0):
+        self.path = path
+        self.send = send
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.claim_timeout = claim_timeout
+        self._wakeup = threading.Condition()
+        self._start = OncePerProcess(self._start_workers)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sms_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    to_number TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    sid TEXT,
+                    created_at REAL NOT NULL,
+                    claimed_at REAL,
+                    owner TEXT
+                )""")
+            # Outboxes created before claims were recorded
+            columns = {column[1] for column in conn.execute("PRAGMA table_info(sms_outbox)")}
+            for name, kind in (("claimed_at", "REAL"), ("owner", "TEXT")):
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE sms_outbox ADD COLUMN {name} {kind}")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sms_outbox_due ON sms_outbox (status, next_attempt_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A short-lived connection per operation keeps worker threads and
+        # request threads from sharing a sqlite3 connection.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, to, body):
+        return self.enqueue_many([(to, body)])[0]
+
+    def enqueue_many(self, messages):
+        """Store ``[(to, body), ...]`` in one transaction and wake the workers."""
+        now = time.time()
+        ids = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for to, body in messages:
+                cursor = conn.execute(
+                    "INSERT INTO sms_outbox (to_number, body, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                    (to, body, now, now))
+                ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        with self._wakeup:
+            self._wakeup.notify(len(ids))
+        return ids
+
+    def start(self):
+        # Once per process, so workers forked after import send too
+        self._start()
+
+    def _start_workers(self):
+        # A forked child must not wait on the parent's (absent) workers
+        self._wakeup = threading.Condition()
+        for i in range(self.workers):
+            start_daemon(self._work, f"sms-outbox-{i}")
+
+    def _claim(self):
+        # Returns (id, to, body, attempts, owner) of one due message, or the
+        # number of seconds until the next one is due (None if nothing is pending).
+        now = time.time()
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Claims this old were left by a process that died mid-send
+            conn.execute(
+                "UPDATE sms_outbox SET status = 'pending', owner = NULL "
+                "WHERE status = 'sending' AND (claimed_at IS NULL OR claimed_at < ?)",
+                (now - self.claim_timeout,))
+            row = conn.execute(
+                "SELECT id, to_number, body, attempts, next_attempt_at FROM sms_outbox "
+                "WHERE status = 'pending' ORDER BY next_attempt_at, id LIMIT 1").fetchone()
+            if row is None or row[4] > now:
+                conn.execute("COMMIT")
+                return None if row is None else row[4] - now
+            conn.execute("UPDATE sms_outbox SET status = 'sending', claimed_at = ?, owner = ? WHERE id = ?",
+                         (now, owner, row[0]))
+            conn.execute("COMMIT")
+            return row[:4] + (owner,)
+
+    def _work(self):
+        # A database error (locked file, full disk) must not end the sender;
+        # a claim it could not settle is retried when its lease runs out
+        failures = 0
+        while True:
+            try:
+                claimed = self._claim()
+                if isinstance(claimed, tuple):
+                    self._deliver(*claimed)
+                failures = 0
+            except Exception:
+                failures += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (failures - 1)) * random.uniform(0.5, 1.5)
+                log.exception("SMS outbox worker failed (attempt %d)", failures,
+                              extra={"retry_in": round(delay, 2)})
+                time.sleep(delay)
+                continue
+            if not isinstance(claimed, tuple):
+                with self._wakeup:
+                    self._wakeup.wait(timeout=min(claimed, 5.0) if claimed is not None else 5.0)
+
+    def _deliver(self, message_id, to, body, attempts, owner):
+        attempts += 1
+        try:
+            sid = self.send(to, body)
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                status, next_attempt_at = 'failed', time.time()
+            else:
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+                status, next_attempt_at = 'pending', time.time() + delay * random.uniform(0.5, 1.5)
+            log.warning("SMS %s failed (attempt %d): %s", message_id, attempts, e,
+                        extra={"sms_id": message_id, "status": status})
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE sms_outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, "
+                    "owner = NULL WHERE id = ? AND owner = ?",
+                    (status, attempts, next_attempt_at, str(e), message_id, owner))
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE sms_outbox SET status = 'sent', attempts = ?, sid = ?, last_error = NULL "
+                "WHERE id = ? AND owner = ?",
+                (attempts, sid, message_id, owner))
+
+    def counts(self):
+        """Return ``{status: number_of_messages}``."""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM sms_outbox GROUP BY status"))
+
+    def drain(self, timeout=10.0):
+        """Wait until no message is pending or sending; True if it got there in time."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            counts = self.counts()
+            if not counts.get('pending') and not counts.get('sending'):
+                return True
+            time.sleep(0.05)
+        return False
@@ -0,0 +1,115 @@
+import enum
+import functools
+from datetime import date, datetime
+
+from storage import OUTING_COLUMNS
+
+SHEET_DATE_FORMAT = "%d-%m-%Y"
+
+
+class Status(str, enum.Enum):
+    OUT = "OUT"
+    IN = "IN"
+
+
+class Approval(str, enum.Enum):
+    PENDING = ""
+    APPROVED = "APPROVED"
+    REJECTED = "REJECTED"
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date(value):
+    # (date or original text, original text if the date formats back
+    # differently, as 5-1-2099 does); serializing uses the original so it
+    # never rewrites what the sheet holds
+    try:
+        parsed = datetime.strptime(value, SHEET_DATE_FORMAT).date()
+    except ValueError:
+        return value, None
+    return parsed, (None if parsed.strftime(SHEET_DATE_FORMAT) == value else value)
+
+
+_STATUSES = {member.value: member for member in Status}
+_APPROVALS = {member.value: member for member in Approval}
+
+
+def _parse_enum(members, value):
+    return members.get(value.strip().upper(), value)
+
+
+def _text(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.strftime(SHEET_DATE_FORMAT)
+    return value
+
+
+# Attribute for each warden-sheet column, in column order
+FIELDS = (
+    "student_id", "face_id", "name", "mobile_number", "gender", "hostel_name",
+    "room_no", "batch", "course", "neet_jee", "reason", "out_date", "status",
+    "out_approval", "out_warden", "out_remarks", "out_time",
+    "in_date", "in_approval", "in_warden", "in_remarks", "in_time",
+)
+_WIDTH = len(FIELDS)
+_COLUMNS = tuple(zip(FIELDS, OUTING_COLUMNS))
+
+
+class Outing:
+    """One outing request, parsed once from its A:V sheet row.
+
+    OutDate and InDate are ``date`` objects, Status a ``Status`` and the
+    warden approvals an ``Approval``; values that do not parse (missing
+    cells, free text) are kept as the original string. ``to_dict`` gives
+    the JSON shape every route returns, keyed by sheet column name, with
+    dates written as the sheet has them; it is built on first use and
+    shared afterwards, so treat it as read-only.
+    """
+
+    __slots__ = FIELDS + ("_dict", "_date_texts")
+
+    def __init__(self, **values):
+        for field in FIELDS:
+            setattr(self, field, values.get(field, ""))
+        self._dict = None
+        self._date_texts = None
+
+    @classmethod
+    def from_row(cls, row):
+        outing = cls.__new__(cls)
+        if len(row) < _WIDTH:
+            row = list(row) + [""] * (_WIDTH - len(row))
+        for field, value in zip(FIELDS, row):
+            setattr(outing, field, value)
+        outing.out_date, out_text = _parse_date(outing.out_date)
+        outing.in_date, in_text = _parse_date(outing.in_date)
+        outing._date_texts = None
+        if out_text or in_text:
+            outing._date_texts = {"OutDate": out_text, "InDate": in_text}
+        outing.status = _parse_enum(_STATUSES, outing.status)
+        outing.out_approval = _parse_enum(_APPROVALS, outing.out_approval)
+        outing.in_approval = _parse_enum(_APPROVALS, outing.in_approval)
+        outing._dict = None
+        return outing
+
+    def to_dict(self):
+        if self._dict is None:
+            self._dict = {column: _text(getattr(self, field)) for field, column in _COLUMNS}
+            if self._date_texts:
+                self._dict.update((column, text) for column, text in self._date_texts.items() if text)
+        return self._dict
+
+    def __eq__(self, other):
+        if not isinstance(other, Outing):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in FIELDS)
+
+    def __repr__(self):
+        return f"Outing({self.student_id!r}, out_date={self.out_date!r}, status={self.status!r})"
+
+
+def serialize(outings):
+    """JSON-ready list of records for ``[Outing, ...]``."""
+    return [outing.to_dict() for outing in outings]
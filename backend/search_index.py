@@ -0,0 +1,117 @@
+import bisect
+import collections
+import heapq
+import re
+import threading
+
+from outing import Outing
+
+# Outing attributes the guard search matches against
+SEARCH_FIELDS = ("name", "room_no", "hostel_name", "face_id")
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """Lower-cased words of ``text``: runs of letters and digits."""
+    return _WORD.findall(text.casefold())
+
+
+class OutingSearchIndex:
+    """Inverted index over the Name, RoomNo, HostelName and FaceId of every outing.
+
+    Registered as a storage listener like ``DashboardViews``:
+    ``row_changed`` re-indexes a single row and ``reset`` rebuilds the
+    index after the storage reloads. Words are kept in a sorted list next
+    to their postings, so a prefix finds its words with a binary search.
+
+    ``search`` matches every word of the query as a case-insensitive
+    prefix of some indexed word of the same outing. A whole-word match
+    scores 2 and a prefix match 1; a query equal to an entire field (a
+    room number, a full name) scores 3 more. Ties go to the newest row.
+    """
+
+    def __init__(self, storage, max_terms=8):
+        self.storage = storage
+        self.max_terms = max_terms
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._words = []
+        self._rows = {}
+        storage.add_listener(self)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def reset(self, outings):
+        with self._lock:
+            self._postings = {}
+            self._rows = {}
+            for row_id, row in outings():
+                self._add(row_id, Outing.from_row(row), sort=False)
+            self._words = sorted(self._postings)
+
+    def row_changed(self, row_id, row):
+        with self._lock:
+            self._remove(row_id)
+            self._add(row_id, Outing.from_row(row), sort=True)
+
+    def _add(self, row_id, outing, sort):
+        # Called with the lock held
+        values = tuple(" ".join(tokenize(getattr(outing, field))) for field in SEARCH_FIELDS)
+        words = {word for value in values for word in value.split()}
+        self._rows[row_id] = (outing, words, values)
+        for word in words:
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = set()
+                if sort:
+                    bisect.insort(self._words, word)
+            posting.add(row_id)
+
+    def _remove(self, row_id):
+        # Called with the lock held
+        entry = self._rows.pop(row_id, None)
+        if entry is None:
+            return
+        for word in entry[1]:
+            posting = self._postings[word]
+            posting.discard(row_id)
+            if not posting:
+                del self._postings[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+
+    def _matches(self, term):
+        # Row ids with a word starting with ``term``
+        words = self._words
+        first = bisect.bisect_left(words, term)
+        last = bisect.bisect_left(words, term + "\U0010ffff", first)
+        if last - first == 1:
+            return self._postings[words[first]]
+        return set().union(*(self._postings[word] for word in words[first:last]))
+
+    def search(self, query, limit=20):
+        """Return up to ``limit`` ``(row_id, outing)`` pairs matching ``query``, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))[:self.max_terms]
+        if not terms or limit <= 0:
+            return []
+        whole = " ".join(tokenize(query))
+        self.storage.refresh()
+        with self._lock:
+            matches = sorted((self._matches(term) for term in terms), key=len)
+            candidates = matches[0].intersection(*matches[1:])
+            if not candidates:
+                return []
+            # Whole-word matches per row, counted with set operations
+            exact = collections.Counter()
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting:
+                    exact.update(posting & candidates)
+            ranked = heapq.nlargest(limit, exact.items(), key=lambda item: (
+                2 * item[1] + (3 if item[1] == len(terms) and whole in self._rows[item[0]][2] else 0), item[0]))
+            best = [row_id for row_id, _ in ranked]
+            if len(best) < limit:
+                # The rest only match by prefix; newest first
+                best += heapq.nlargest(limit - len(best), candidates.difference(exact))
+            return [(row_id, self._rows[row_id][0]) for row_id in best]
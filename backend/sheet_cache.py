@@ -0,0 +1,281 @@
+import bisect
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class StaleRowError(Exception):
+    """A row changed between reading it and writing to it."""
+
+
+class RowCache:
+    """Shared read-through cache of a sheet's rows.
+
+    Rows are loaded with ``fetch(previous)`` on first use and reused by
+    every route until ``ttl`` seconds pass or a write clears them.
+    ``previous`` is the last loaded row list (None the first time), which
+    ``fetch`` may reuse rows from instead of downloading them again. Writes made through
+    the app patch the cached rows in place so the next dashboard poll does
+    not have to go back to Google.
+
+    Alongside the rows it keeps two hash indexes, StudentId -> row numbers
+    and (StudentId, OutDate) -> row number, built once per load and kept
+    up to date by ``patch`` and ``append``.
+
+    Each row also carries a version that changes whenever this process
+    patches it or reloads the sheet. Writers hold ``row_lock`` and compare
+    versions so that two concurrent updates to one row cannot silently
+    overwrite each other.
+
+    The returned rows are shared between requests and must be treated as
+    read-only; copy a row before changing it.
+
+    One caller at a time fetches, without holding the lock. While it does,
+    other callers keep reading the expired rows, or wait if there are none
+    (the first load, or after ``invalidate``). Writes recorded meanwhile
+    are applied again on top of the fetched rows. If a reload fails and
+    there are rows to fall back on, they keep being served, the failure is
+    logged and counted in ``refresh_failures``, and the reload is retried
+    after ``retry_after`` seconds; with nothing to serve, the error is
+    raised.
+
+    ``hits`` and ``misses`` count lookups served from memory and lookups
+    that had to fetch the sheet.
+    """
+
+    def __init__(self, fetch, ttl=15, max_append_gap=64, retry_after=5.0):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.max_append_gap = max_append_gap
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._loaded = threading.Condition(self._lock)
+        self._loading = False
+        self._replay = None
+        self._invalidated = False
+        self._rows = None
+        self._previous = None
+        self._loaded_at = 0.0
+        self._by_student = {}
+        self._by_outing = {}
+        self._generation = 0
+        self._versions = {}
+        self._row_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.refresh_failures = 0
+
+    @property
+    def generation(self):
+        """Number of times the rows have been (re)loaded."""
+        return self._generation
+
+    def _expired(self):
+        return self._rows is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _ensure_loaded(self):
+        # Called with the lock held
+        if not self._expired():
+            self.hits += 1
+            return
+        while self._expired():
+            if not self._loading:
+                self.misses += 1
+                self._load()
+            elif self._rows is not None:
+                self.hits += 1  # Stale, until the load in flight lands
+                return
+            else:
+                self._loaded.wait()
+
+    def _load(self):
+        # Called with the lock held; releases it while fetching
+        self._loading = True
+        self._invalidated = False
+        self._replay = []
+        previous = self._previous
+        self._lock.release()
+        try:
+            rows, error = self._fetch(previous), None
+        except Exception as e:
+            rows, error = None, e
+        finally:
+            self._lock.acquire()
+            self._loading = False
+            replay, self._replay = self._replay, None
+            self._loaded.notify_all()
+        if error is not None:
+            if self._rows is None:
+                raise error
+            self.refresh_failures += 1
+            retry = min(self.ttl, self.retry_after)
+            log.warning("sheet reload failed, serving the cached rows and retrying in %.0fs: %s", retry, error)
+            self._loaded_at = time.monotonic() - self.ttl + retry
+            return
+
+        self._rows = self._previous = rows
+        self._loaded_at = time.monotonic()
+        self._generation += 1
+        self._versions = {}
+        self._by_student = {}
+        self._by_outing = {}
+        for idx, row in enumerate(self._rows):
+            self._index_row(idx + 2, row)
+        # Writes made while fetching, which the fetch may have missed
+        for apply, row_number, values in replay:
+            if self._rows is not None:
+                apply(row_number, values)
+        if self._invalidated:
+            self._rows = None
+
+    def _index_row(self, row_number, row):
+        if not row:
+            return
+        student_id = row[0].strip()
+        bisect.insort(self._by_student.setdefault(student_id, []), row_number)
+        if len(row) > 11:
+            key = (student_id, row[11])
+            # Keep the first matching row, as a top-down scan would find
+            if self._by_outing.get(key, row_number) >= row_number:
+                self._by_outing[key] = row_number
+
+    def _unindex_row(self, row_number, row):
+        if not row:
+            return
+        student_id = row[0].strip()
+        numbers = self._by_student.get(student_id, [])
+        if row_number in numbers:
+            numbers.remove(row_number)
+        if not numbers:
+            self._by_student.pop(student_id, None)
+        if len(row) > 11:
+            key = (student_id, row[11])
+            if self._by_outing.get(key) == row_number:
+                del self._by_outing[key]
+                for other in numbers:
+                    other_row = self._rows[other - 2]
+                    if len(other_row) > 11 and other_row[11] == row[11]:
+                        self._by_outing[key] = other
+                        break
+
+    def rows(self):
+        with self._lock:
+            self._ensure_loaded()
+            return self._rows
+
+    def snapshot(self):
+        """Return ``(rows, generation)`` of the same load."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._rows, self._generation
+
+    def student_rows(self, student_id):
+        """Return ``[(row_number, row), ...]`` for a StudentId in sheet order."""
+        with self._lock:
+            self._ensure_loaded()
+            numbers = self._by_student.get(str(student_id).strip(), [])
+            return [(number, self._rows[number - 2]) for number in numbers]
+
+    def find_outing(self, student_id, out_date):
+        """Return ``(row_number, row)`` for a StudentId and OutDate, or ``(None, None)``."""
+        with self._lock:
+            self._ensure_loaded()
+            number = self._by_outing.get((str(student_id).strip(), out_date))
+            if number is None:
+                return None, None
+            return number, self._rows[number - 2]
+
+    def row(self, row_number):
+        """Return ``(row, version)`` for sheet row ``row_number``."""
+        with self._lock:
+            self._ensure_loaded()
+            idx = row_number - 2
+            if not 0 <= idx < len(self._rows):
+                return None, None
+            return self._rows[idx], self._version(row_number)
+
+    def _version(self, row_number):
+        return self._generation, self._versions.get(row_number, 0)
+
+    def version(self, row_number):
+        with self._lock:
+            if self._rows is None:
+                return None
+            return self._version(row_number)
+
+    def row_lock(self, row_number):
+        """Lock serialising writes to one sheet row within this process."""
+        with self._lock:
+            return self._row_locks.setdefault(row_number, threading.Lock())
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+            # A load in flight may have fetched before the change
+            self._invalidated = self._loading
+
+    def patch(self, row_number, updates):
+        """Apply ``{column_index: value}`` to sheet row ``row_number``."""
+        with self._lock:
+            if self._loading:
+                self._replay.append((self._patch, row_number, updates))
+            if self._rows is not None:
+                self._patch(row_number, updates)
+
+    def _patch(self, row_number, updates):
+        # Called with the lock held
+        idx = row_number - 2  # Row 1 is the header
+        if not 0 <= idx < len(self._rows):
+            self._rows = None
+            return
+        old_row = self._rows[idx]
+        row = list(old_row)
+        width = max(updates) + 1
+        if len(row) < width:
+            row.extend([''] * (width - len(row)))
+        for column, value in updates.items():
+            row[column] = value
+        self._rows[idx] = row
+        self._versions[row_number] = self._versions.get(row_number, 0) + 1
+        if 0 in updates or 11 in updates:
+            self._unindex_row(row_number, old_row)
+            self._index_row(row_number, row)
+
+    def append(self, row_number, row):
+        """Record a row appended upstream at sheet row ``row_number``.
+
+        Appends may be recorded out of order: rows skipped over (appended
+        by another request or process) are held as empty placeholders,
+        which a later ``append`` fills or the next reload replaces. A gap
+        of more than ``max_append_gap`` rows, or a slot that already holds
+        a different row, clears the cache instead.
+        """
+        with self._lock:
+            if self._loading:
+                self._replay.append((self._refill, row_number, row))
+            if self._rows is not None:
+                self._append(row_number, row)
+
+    def _append(self, row_number, row):
+        # Called with the lock held
+        idx = row_number - 2
+        gap = idx - len(self._rows)
+        if gap > self.max_append_gap or idx < 0 or (gap < 0 and self._rows[idx] not in ([], list(row))):
+            self._rows = None
+            return
+        if gap >= 0:
+            self._rows.extend([] for _ in range(gap + 1))
+        elif self._rows[idx]:
+            return  # Already recorded
+        self._rows[idx] = list(row)
+        self._versions[row_number] = self._versions.get(row_number, 0) + 1
+        self._index_row(row_number, self._rows[idx])
+
+    def _refill(self, row_number, row):
+        # Replays an append after a load, which may already hold the row
+        idx = row_number - 2
+        if idx < len(self._rows) and self._rows[idx]:
+            return
+        self._append(row_number, row)
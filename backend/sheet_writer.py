@@ -0,0 +1,91 @@
+def column_index(column):
+    # "A" -> 0, "N" -> 13, "AA" -> 26
+    index = 0
+    for letter in column:
+        index = index * 26 + ord(letter.upper()) - ord('A') + 1
+    return index - 1
+
+
+def column_letter(index):
+    # 0 -> "A", 13 -> "N", 26 -> "AA"
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+class CellBatch:
+    """Cell changes for one logical operation, sent as one batchUpdate.
+
+    Cells are collected with ``set`` and written by ``execute`` in a single
+    ``spreadsheets().values().batchUpdate`` call. Neighbouring cells in the
+    same row are merged into one range, so a warden approval (N, O, P) goes
+    out as ``Sheet1!N5:P5``.
+    """
+
+    def __init__(self, spreadsheet_id, sheet="Sheet1", value_input_option="RAW"):
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet = sheet
+        self.value_input_option = value_input_option
+        self._cells = {}  # (row_number, column_index) -> value
+
+    def __len__(self):
+        return len(self._cells)
+
+    def set(self, row_number, column, value):
+        self._cells[(row_number, column_index(column))] = value
+
+    def _runs(self):
+        # Yield (row_number, first_column_index, [values]) for each run of
+        # adjacent columns in the same row.
+        run = None
+        for (row_number, column), value in sorted(self._cells.items()):
+            if run and run[0] == row_number and run[1] + len(run[2]) == column:
+                run[2].append(value)
+                continue
+            if run:
+                yield run
+            run = (row_number, column, [value])
+        if run:
+            yield run
+
+    def execute(self, service):
+        """Write the batch and return ``{row_number: {column_index: stored_value}}``.
+
+        The stored values are the ones Sheets reports back, which can differ
+        from what was sent when ``USER_ENTERED`` parsing applies.
+        """
+        runs = list(self._runs())
+        if not runs:
+            return {}
+        data = []
+        for row_number, column, values in runs:
+            start = column_letter(column)
+            end = column_letter(column + len(values) - 1)
+            data.append({
+                "range": f"{self.sheet}!{start}{row_number}:{end}{row_number}",
+                "values": [values],
+            })
+        response = service.spreadsheets().values().batchUpdate(
+            spreadsheetId=self.spreadsheet_id,
+            body={
+                "valueInputOption": self.value_input_option,
+                "includeValuesInResponse": True,
+                "data": data,
+            }
+        ).execute()
+
+        responses = response.get('responses', [])
+        stored = {}
+        for i, (row_number, column, values) in enumerate(runs):
+            returned = responses[i].get('updatedData', {}).get('values') if i < len(responses) else None
+            if returned is None:
+                returned = [["" if value is None else value for value in values]]
+            # Sheets drops trailing empty cells from the returned values
+            returned_row = returned[0] if returned else []
+            updates = stored.setdefault(row_number, {})
+            for offset in range(len(values)):
+                updates[column + offset] = returned_row[offset] if offset < len(returned_row) else ""
+        return stored
@@ -0,0 +1,278 @@
+import queue
+import random
+import threading
+import time
+
+# Calls that only read; identical concurrent ones share one request
+READ_METHODS = {"get", "values.get", "values.batchGet"}
+# Appending twice adds two rows and deleting twice removes the wrong ones,
+# so these are only retried when Google refused them outright (429); any
+# other failure may already have applied them
+NON_IDEMPOTENT_METHODS = {"values.append", "batchUpdate"}
+
+
+class RateLimited(Exception):
+    """Raised when no Sheets quota frees up within the allowed wait."""
+
+
+def error_status(error):
+    """HTTP status of a failed Sheets call (``googleapiclient.errors.HttpError``), or None."""
+    resp = getattr(error, "resp", None)
+    status = getattr(resp, "status", None) or getattr(error, "status_code", None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(error):
+    """True for failures worth retrying shortly: quota, 429/5xx answers and network errors."""
+    if isinstance(error, (RateLimited, OSError)):
+        return True
+    status = error_status(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+class TokenBucket:
+    """Allows ``rate`` calls per second on average and bursts of up to ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        """Take a token, waiting up to ``timeout`` seconds; False if none came free."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving meanwhile get its outcome."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return ``(result, shared)``; ``shared`` is True if another caller did the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class SheetsGate:
+    """Admission control shared by every Sheets call the app makes.
+
+    - Identical reads in flight at the same time share one request.
+    - Reads and writes each draw from a token bucket sized to the Sheets
+      per-minute quota; a call waits up to ``max_wait`` seconds for a token,
+      then raises ``RateLimited``. A rate of 0 disables the limit.
+    - Calls failing with 429 or 5xx are retried up to ``max_retries`` times
+      with jittered exponential backoff.
+
+    ``wrap(client)`` returns a client whose ``execute()`` calls go through
+    the gate. ``coalesced``, ``retries`` and ``throttled`` count what the
+    gate did.
+    """
+
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, burst=10, max_wait=10.0,
+                 max_retries=4, backoff=0.5, max_backoff=16.0):
+        self._buckets = {
+            kind: TokenBucket(per_minute / 60.0, min(burst, per_minute)) if per_minute else None
+            for kind, per_minute in (("read", reads_per_minute), ("write", writes_per_minute))
+        }
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._flights = SingleFlight()
+        self._stats_lock = threading.Lock()
+        self.coalesced = 0
+        self.retries = 0
+        self.throttled = 0
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def wrap(self, client):
+        return _GatedClient(client, self, "", {})
+
+    def execute(self, method, kwargs, run):
+        if method in READ_METHODS:
+            key = (method, repr(sorted(kwargs.items())))
+            result, shared = self._flights.do(key, lambda: self._attempt(method, run))
+            if shared:
+                self._count("coalesced")
+            return result
+        return self._attempt(method, run)
+
+    def _admit(self, method):
+        bucket = self._buckets["read" if method in READ_METHODS else "write"]
+        if bucket is not None and not bucket.acquire(self.max_wait):
+            self._count("throttled")
+            raise RateLimited(f"Sheets quota exhausted for {method}")
+
+    def _retryable(self, method, status):
+        if status == 429:
+            return True
+        return status is not None and 500 <= status < 600 and method not in NON_IDEMPOTENT_METHODS
+
+    def _attempt(self, method, run):
+        for attempt in range(self.max_retries + 1):
+            self._admit(method)
+            try:
+                return run()
+            except Exception as e:
+                if attempt == self.max_retries or not self._retryable(method, error_status(e)):
+                    raise
+            self._count("retries")
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+
+class _GatedClient:
+    # Follows the spreadsheets().values().get(...) chain, remembering the
+    # method name and its arguments for the final execute()
+
+    def __init__(self, target, gate, method, kwargs):
+        self._target = target
+        self._gate = gate
+        self._method = method
+        self._kwargs = kwargs
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name == "execute":
+            def execute(*args, **kwargs):
+                return self._gate.execute(self._method, self._kwargs, lambda: attr(*args, **kwargs))
+            return execute
+        if not callable(attr):
+            return attr
+        method = self._method if name == "spreadsheets" else (f"{self._method}.{name}" if self._method else name)
+
+        def call(*args, **kwargs):
+            return _GatedClient(attr(*args, **kwargs), self._gate, method, kwargs)
+        return call
+
+
+class SheetsClientPool:
+    """Sheets API clients shared by request threads, one caller at a time each.
+
+    An httplib2 connection must not be used by two threads at once, so every
+    ``execute()`` checks a client out, runs on it and hands it back. Idle
+    clients are reused most-recent first, which keeps their keep-alive
+    connections warm. Up to ``size`` clients are built by ``factory`` as
+    demand grows; beyond that, callers wait for a free one.
+
+    ``client()`` returns a handle that can be chained like a real client
+    (``client().spreadsheets().values().get(...).execute()``) and is safe to
+    keep and share.
+    """
+
+    def __init__(self, factory, size=8):
+        self._factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.built = 0
+        self.in_use = 0
+
+    def client(self):
+        return _PooledClient(self, ())
+
+    def warm(self, count=1):
+        """Build up to ``count`` clients ahead of the first call."""
+        clients = [self._checkout() for _ in range(min(count, self.size))]
+        for client in clients:
+            self._checkin(client)
+
+    def _checkout(self):
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                build = self.built < self.size
+                if build:
+                    self.built += 1
+            if build:
+                try:
+                    client = self._factory()
+                except Exception:
+                    with self._lock:
+                        self.built -= 1
+                    raise
+            else:
+                client = self._idle.get()
+        with self._lock:
+            self.in_use += 1
+        return client
+
+    def _checkin(self, client):
+        with self._lock:
+            self.in_use -= 1
+        self._idle.put(client)
+
+    def run(self, steps, args, kwargs):
+        client = self._checkout()
+        try:
+            target = client
+            for name, step_args, step_kwargs in steps:
+                target = getattr(target, name)(*step_args, **step_kwargs)
+            return target.execute(*args, **kwargs)
+        finally:
+            self._checkin(client)
+
+
+class _PooledClient:
+    # Records the spreadsheets().values().get(...) chain and replays it on a
+    # checked-out client when execute() is called
+
+    def __init__(self, pool, steps):
+        self._pool = pool
+        self._steps = steps
+
+    def __getattr__(self, name):
+        if name == "execute":
+            return lambda *args, **kwargs: self._pool.run(self._steps, args, kwargs)
+
+        def call(*args, **kwargs):
+            return _PooledClient(self._pool, self._steps + ((name, args, kwargs),))
+        return call
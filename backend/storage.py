@@ -0,0 +1,761 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+
+from sheet_cache import RowCache, StaleRowError
+from sheet_writer import CellBatch, column_letter
+from student_directory import StudentDirectory
+
+log = logging.getLogger(__name__)
+
+# Columns A:V of the warden sheet, in order
+OUTING_COLUMNS = [
+    "StudentId", "FaceId", "Name", "MobileNumber", "Gender", "HostelName",
+    "RoomNo", "Batch", "Course", "NEET_JEE", "Reason", "OutDate", "Status",
+    "Warden_OutApproval", "WardenNameOut", "WardenRemarksOut", "OutTime",
+    "InDate", "Warden_InApproval", "WardenNameIn", "WardenRemarksIn", "InTime",
+]
+COLUMN = {name: index for index, name in enumerate(OUTING_COLUMNS)}
+
+# Columns compared by partial reloads: StudentId (A) and everything from
+# OutDate on (L:V), i.e. every column that changes after an outing is
+# submitted and that the dashboards, indexes, archive, curfew watch and
+# reports read. The student details (B:K) are copied in at submit and only
+# change by hand in the sheet; such edits wait for the next full reload.
+KEY_SPANS = ((0, 0), (11, 21))
+KEY_COLUMNS = tuple(column for first, last in KEY_SPANS for column in range(first, last + 1))
+
+
+def row_key(row):
+    return tuple(row[column] if column < len(row) else "" for column in KEY_COLUMNS)
+
+
+class Storage:
+    """Data access used by the routes.
+
+    Outing requests are handed out as ``(row_id, row)`` pairs. ``row`` is the
+    A:V list of strings the warden sheet holds (trailing empty cells dropped,
+    as the Sheets API does) and ``row_id`` is a stable handle for writing it
+    back: the sheet row number for Google Sheets, the primary key for SQLite.
+
+    Backends implement the lookups and ``update_outings``; approvals and gate
+    events are expressed on top of it here so they behave the same
+    everywhere.
+
+    Listeners registered with ``add_listener`` hear about every outing this
+    process writes (``row_changed(row_id, row)``) and about wholesale
+    reloads (``reset(outings)``, with a callable returning every
+    ``(row_id, row)``), which ``refresh`` triggers when the data was changed
+    elsewhere.
+    """
+
+    def __init__(self):
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify_reset(self, outings):
+        for listener in self._listeners:
+            listener.reset(outings)
+
+    def _notify_rows(self, row_ids):
+        if not self._listeners:
+            return
+        for row_id in row_ids:
+            row, _ = self.get_outing(row_id)
+            if row is None:
+                continue
+            for listener in self._listeners:
+                listener.row_changed(row_id, row)
+
+    def refresh(self):
+        """Pick up changes made outside this process, resetting listeners if needed."""
+        raise NotImplementedError
+
+    def renumbered(self):
+        """Forget cached row ids; another process removed rows and renumbered the rest."""
+
+    def start(self):
+        """Begin any preloading and background refreshing the backend does."""
+
+    def get_student(self, student_id):
+        """Return the student-sheet row (A:K) for ``student_id``, or None."""
+        raise NotImplementedError
+
+    def outings(self):
+        """Return every outing request as ``[(row_id, row), ...]``."""
+        raise NotImplementedError
+
+    def student_outings(self, student_id):
+        raise NotImplementedError
+
+    def find_outing(self, student_id, out_date):
+        """Return ``(row_id, row)`` for a StudentId and OutDate, or ``(None, None)``."""
+        raise NotImplementedError
+
+    def get_outing(self, row_id):
+        """Return ``(row, version)`` for ``row_id``, or ``(None, None)``."""
+        raise NotImplementedError
+
+    def add_outing(self, row):
+        """Store a new outing request and return its ``row_id``."""
+        raise NotImplementedError
+
+    def update_outings(self, changes, value_input_option="RAW"):
+        """Apply ``[(row_id, {column_index: value}, expected_version), ...]`` as one write.
+
+        ``expected_version`` may be None to skip the check; otherwise
+        ``StaleRowError`` is raised, before anything is written, if that row
+        changed since it was read.
+        """
+        raise NotImplementedError
+
+    def remove_outings(self, rows):
+        """Delete ``[(row_id, expected_version), ...]`` and return how many were removed.
+
+        Rows that changed since ``expected_version`` (None skips the check)
+        are left in place. On Google Sheets the rows after a removed one
+        are renumbered, so callers must keep row ids from being used across
+        the call.
+        """
+        raise NotImplementedError
+
+    def update_outing(self, row_id, updates, expected_version=None, value_input_option="RAW"):
+        self.update_outings([(row_id, updates, expected_version)], value_input_option)
+
+    # Domain operations
+
+    def request_in(self, row_id, in_date):
+        # Student asks to come back: InDate (R) and Status (M) = "IN"
+        self.update_outing(row_id, {COLUMN["InDate"]: in_date, COLUMN["Status"]: "IN"},
+                           value_input_option="USER_ENTERED")
+
+    def set_out_approval(self, row_id, approval_status, warden_name, remarks):
+        self.set_out_approvals([(row_id, approval_status, warden_name, remarks)])
+
+    def set_in_approval(self, row_id, approval_status, warden_name, remarks):
+        self.set_in_approvals([(row_id, approval_status, warden_name, remarks)])
+
+    def set_out_approvals(self, decisions):
+        # [(row_id, approval_status, warden_name, remarks), ...] as one write
+        self.update_outings([(row_id, {
+            COLUMN["Warden_OutApproval"]: approval_status,
+            COLUMN["WardenNameOut"]: warden_name,
+            COLUMN["WardenRemarksOut"]: remarks,
+        }, None) for row_id, approval_status, warden_name, remarks in decisions])
+
+    def set_in_approvals(self, decisions):
+        self.update_outings([(row_id, {
+            COLUMN["Warden_InApproval"]: approval_status,
+            COLUMN["WardenNameIn"]: warden_name,
+            COLUMN["WardenRemarksIn"]: remarks,
+        }, None) for row_id, approval_status, warden_name, remarks in decisions])
+
+    def record_gate_event(self, row_id, status, time, expected_version=None):
+        self.record_gate_events([(row_id, status, time, expected_version)])
+
+    def record_gate_events(self, events):
+        # Guard scans [(row_id, status, time, expected_version), ...] as one
+        # write: Status (M), plus OutTime (Q) or InTime (V). Several scans of
+        # one row are applied in order, so the last Status wins.
+        changes = {}
+        for row_id, status, time, expected_version in events:
+            updates = changes.setdefault(row_id, ({}, expected_version))[0]
+            updates[COLUMN["Status"]] = status
+            if status == "OUT":
+                updates[COLUMN["OutTime"]] = time
+            elif status == "IN":
+                updates[COLUMN["InTime"]] = time
+        self.update_outings([(row_id, updates, expected_version)
+                             for row_id, (updates, expected_version) in changes.items()])
+
+
+class SheetsStorage(Storage):
+    """The Google Sheets backend: warden and student spreadsheets.
+
+    Reads go through a shared ``RowCache``; writes are sent as one
+    ``CellBatch`` and patched into the cache. ``get_service`` returns the
+    Sheets API client to use for each call.
+
+    Reloads are two-phase: only the ``KEY_SPANS`` columns are downloaded,
+    and full rows are fetched with one ``batchGet`` for the rows whose key
+    columns differ from the cached copy. The key columns cover everything
+    but the student details (B:K); hand edits to those are picked up by a
+    full download every ``full_reload_every`` loads, so they are at most
+    ``full_reload_every * cache_ttl`` seconds stale (two minutes with the
+    defaults). More than ``max_changed_share`` of the rows changing also
+    triggers a full download.
+
+    ``refresh`` tells listeners about the rows a reload changed with
+    ``row_changed``. It falls back to ``reset`` after the first load, after
+    rows were removed or the sheet shrank, and when more than
+    ``max_changed_share`` of the rows changed.
+
+    Students are looked up in ``students``, a ``StudentDirectory`` of the
+    student sheet refreshed every ``student_refresh_interval`` seconds.
+    """
+
+    def __init__(self, get_service, warden_sheet_id, student_sheet_id, cache_ttl=15,
+                 full_reload_every=8, max_changed_share=0.25, student_refresh_interval=300.0):
+        super().__init__()
+        self.get_service = get_service
+        self.warden_sheet_id = warden_sheet_id
+        self.student_sheet_id = student_sheet_id
+        self.full_reload_every = full_reload_every
+        self.max_changed_share = max_changed_share
+        self._loads = 0
+        self.rows = RowCache(self._fetch_warden_rows, ttl=cache_ttl)
+        self._reset_lock = threading.Lock()
+        self._seen_generation = None
+        # Generation -> positions that load changed, None when it replaced the rows wholesale
+        self._reloads = {}
+        self._renumbered = False
+        self._warden_gid = None
+        self.students = StudentDirectory(
+            self._fetch_all_students, self._fetch_student_ids,
+            lambda positions: self._fetch_rows(self.student_sheet_id, positions),
+            interval=student_refresh_interval)
+
+    def _fetch_warden_rows(self, previous):
+        # Called by the cache, one load at a time
+        rows, changed = self._download_warden_rows(previous)
+        if (previous is None or self._renumbered or len(rows) < len(previous)
+                or len(changed) > max(1, len(rows) * self.max_changed_share)):
+            changed = None
+        self._renumbered = False
+        self._reloads[self.rows.generation + 1] = changed
+        return rows
+
+    def _download_warden_rows(self, previous):
+        # ``(rows, changed positions)``; the positions are only meaningful
+        # when ``previous`` is given
+        self._loads += 1
+        if previous is None or self.full_reload_every <= 1 or self._loads % self.full_reload_every == 0:
+            return self._fetch_all_warden_rows(previous)
+
+        values = self.get_service().spreadsheets().values()
+        key_ranges = values.batchGet(
+            spreadsheetId=self.warden_sheet_id,
+            ranges=[f"Sheet1!{column_letter(first)}2:{column_letter(last)}" for first, last in KEY_SPANS],
+        ).execute().get('valueRanges', [])
+        key_columns = [(last - first + 1, value_range.get('values', []))
+                       for (first, last), value_range in zip(KEY_SPANS, key_ranges)]
+        count = max((len(cells) for _, cells in key_columns), default=0)
+        keys = []
+        for idx in range(count):
+            key = []
+            for width, cells in key_columns:
+                row = cells[idx] if idx < len(cells) else []
+                key.extend(row[i] if i < len(row) else "" for i in range(width))
+            keys.append(tuple(key))
+
+        changed = [idx for idx in range(count) if idx >= len(previous) or row_key(previous[idx]) != keys[idx]]
+        if len(changed) > max(1, count * self.max_changed_share):
+            return self._fetch_all_warden_rows(previous)
+        rows = list(previous[:count]) + [[] for _ in range(count - len(previous))]
+        for idx, row in self._fetch_rows(self.warden_sheet_id, changed).items():
+            rows[idx] = row
+        return rows, changed
+
+    def _fetch_rows(self, sheet_id, positions):
+        # Full A:V rows at 0-based ``positions`` below the header, with
+        # consecutive ones fetched as one range, in one batchGet
+        if not positions:
+            return {}
+        spans = []
+        for idx in sorted(positions):
+            if spans and spans[-1][1] == idx - 1:
+                spans[-1][1] = idx
+            else:
+                spans.append([idx, idx])
+        fetched = self.get_service().spreadsheets().values().batchGet(
+            spreadsheetId=sheet_id,
+            ranges=[f"Sheet1!A{first + 2}:V{last + 2}" for first, last in spans],
+        ).execute().get('valueRanges', [])
+        rows = {}
+        for (first, last), value_range in zip(spans, fetched):
+            span_rows = value_range.get('values', [])
+            for offset in range(last - first + 1):
+                rows[first + offset] = span_rows[offset] if offset < len(span_rows) else []
+        return rows
+
+    def _fetch_all_warden_rows(self, previous):
+        result = self.get_service().spreadsheets().values().get(
+            spreadsheetId=self.warden_sheet_id, range="Sheet1!A2:V").execute()
+        rows = result.get('values', [])
+        if previous is None:
+            return rows, None
+        # Patched rows may carry trailing empty cells the API leaves out
+        changed = [idx for idx, row in enumerate(rows)
+                   if idx >= len(previous) or (previous[idx] != row and _trimmed(previous[idx]) != row)]
+        return rows, changed
+
+    def _fetch_all_students(self):
+        return self.get_service().spreadsheets().values().get(
+            spreadsheetId=self.student_sheet_id, range="Sheet1!A2:V").execute().get('values', [])
+
+    def _fetch_student_ids(self):
+        ids = self.get_service().spreadsheets().values().get(
+            spreadsheetId=self.student_sheet_id, range="Sheet1!A2:A").execute().get('values', [])
+        return [cell[0] if cell else "" for cell in ids]
+
+    def start(self):
+        self.students.start()
+
+    def get_student(self, student_id):
+        return self.students.get(student_id)
+
+    def outings(self):
+        return [(idx + 2, row) for idx, row in enumerate(self.rows.rows())]
+
+    def refresh(self):
+        # Report the rows changed by every reload (TTL expiry or
+        # invalidation) since the last call
+        with self._reset_lock:
+            rows, generation = self.rows.snapshot()
+            seen = self._seen_generation
+            if generation == seen:
+                return
+            self._seen_generation = generation
+            changed = None
+            if seen is not None:
+                changed = set()
+                for number in range(seen + 1, generation + 1):
+                    positions = self._reloads.get(number)
+                    if positions is None:
+                        changed = None
+                        break
+                    changed.update(positions)
+            for number in [number for number in self._reloads if number <= generation]:
+                del self._reloads[number]
+            if changed is not None:
+                self._notify_rows([idx + 2 for idx in sorted(changed)])
+                return
+            # Listeners walk the live row list, so a patch landing meanwhile
+            # is either seen here or reported to them afterwards
+            self._notify_reset(lambda: ((idx + 2, row) for idx, row in enumerate(rows)))
+
+    def student_outings(self, student_id):
+        return self.rows.student_rows(student_id)
+
+    def find_outing(self, student_id, out_date):
+        return self.rows.find_outing(student_id, out_date)
+
+    def get_outing(self, row_id):
+        return self.rows.row(row_id)
+
+    def add_outing(self, row):
+        response = self.get_service().spreadsheets().values().append(
+            spreadsheetId=self.warden_sheet_id,
+            range="Sheet1!A:M",
+            valueInputOption="USER_ENTERED",
+            includeValuesInResponse=True,
+            body={"values": [row]}
+        ).execute()
+
+        # Keep the shared cache in step with what Sheets actually stored
+        updates = response.get('updates', {})
+        stored = updates.get('updatedData', {}).get('values', [row])
+        row_number = row_number_from_range(updates['updatedRange'])
+        self.rows.append(row_number, stored[0])
+        self._notify_rows([row_number])
+        return row_number
+
+    def update_outings(self, changes, value_input_option="RAW"):
+        batch = CellBatch(self.warden_sheet_id, value_input_option=value_input_option)
+        for row_number, updates, _ in changes:
+            for column, value in updates.items():
+                batch.set(row_number, column_letter(column), value)
+
+        # Hold the row locks (in row order, to avoid deadlocks) across the
+        # version check and the write
+        locks = [self.rows.row_lock(n) for n in sorted({change[0] for change in changes})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            for row_number, _, expected_version in changes:
+                if expected_version is not None and self.rows.version(row_number) != expected_version:
+                    raise StaleRowError(row_number)
+            for row_number, stored in batch.execute(self.get_service()).items():
+                self.rows.patch(row_number, stored)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        self._notify_rows(sorted({change[0] for change in changes}))
+
+    def _sheet_gid(self):
+        # Row deletion addresses the tab by numeric id rather than by name
+        if self._warden_gid is None:
+            result = self.get_service().spreadsheets().get(
+                spreadsheetId=self.warden_sheet_id, fields="sheets.properties(sheetId,title)").execute()
+            for sheet in result.get('sheets', []):
+                if sheet['properties']['title'] == "Sheet1":
+                    self._warden_gid = sheet['properties']['sheetId']
+        return self._warden_gid
+
+    def remove_outings(self, rows):
+        wanted = dict(rows)
+        locks = [self.rows.row_lock(n) for n in sorted(wanted)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            doomed = {}
+            for row_number, expected_version in wanted.items():
+                row, version = self.rows.row(row_number)
+                if row is not None and (expected_version is None or version == expected_version):
+                    doomed[row_number] = row
+            if not doomed:
+                return 0
+            # Row numbers are only as fresh as the cache, and rows deleted
+            # elsewhere shift the ones below; check them against the sheet
+            fetched = self._fetch_rows(self.warden_sheet_id, [n - 2 for n in doomed])
+            moved = [n for n, row in doomed.items() if fetched.get(n - 2, []) != _trimmed(row)]
+            if moved:
+                log.warning("rows changed in the sheet since they were cached; not removing any",
+                            extra={"rows": sorted(moved)[:20], "moved": len(moved)})
+                self.rows.invalidate()
+                return 0
+            # Bottom-up, so each deletion leaves the numbers of the rest intact
+            gid = self._sheet_gid()
+            self.get_service().spreadsheets().batchUpdate(spreadsheetId=self.warden_sheet_id, body={
+                "requests": [{"deleteDimension": {"range": {
+                    "sheetId": gid, "dimension": "ROWS", "startIndex": n - 1, "endIndex": n}}}
+                    for n in sorted(doomed, reverse=True)],
+            }).execute()
+            # Every row below shifted; reload, which resets the listeners
+            self.renumbered()
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        return len(doomed)
+
+    def renumbered(self):
+        self._renumbered = True
+        self.rows.invalidate()
+
+
+def _trimmed(row):
+    # ``row`` without trailing empty cells, as the Sheets API returns it
+    end = len(row)
+    while end and row[end - 1] == "":
+        end -= 1
+    return row[:end]
+
+
+def row_number_from_range(a1_range):
+    # "Sheet1!A12:M12" -> 12
+    cell = a1_range.split('!')[-1].split(':')[0]
+    return int(cell.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+
+
+class SqliteStorage(Storage):
+    """Local SQLite backend with indexed outing and student tables.
+
+    Each outing carries a ``version`` column; ``update_outings`` only writes
+    when it still matches, so the version check holds across processes
+    sharing the database file.
+
+    Every write also bumps a ``change_seq`` counter. A jump this process did
+    not make itself means another process wrote to the file, and ``refresh``
+    resets the listeners.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._seq_lock = threading.Lock()
+        self._seen_seq = None
+        self._external_change = True
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{name} TEXT NOT NULL DEFAULT ''" for name in OUTING_COLUMNS)
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS outings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                {columns},
+                width INTEGER NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS outings_student ON outings (StudentId);
+            CREATE INDEX IF NOT EXISTS outings_student_out_date ON outings (StudentId, OutDate);
+            CREATE INDEX IF NOT EXISTS outings_status ON outings (Status);
+            CREATE TABLE IF NOT EXISTS students (
+                StudentId TEXT PRIMARY KEY,
+                row TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('change_seq', 0);
+        """)
+
+    def _conn(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    _SELECT = "SELECT id, width, version, " + ", ".join(OUTING_COLUMNS) + " FROM outings"
+
+    @staticmethod
+    def _row(record):
+        # Rebuild the sheet-shaped row, dropping trailing empty cells
+        width = record[1]
+        values = list(record[3:3 + width])
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def _bump_change_seq(self, conn):
+        # Called inside a write transaction, which serialises writers
+        seq = conn.execute("SELECT value FROM meta WHERE key = 'change_seq'").fetchone()[0]
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'change_seq'")
+        with self._seq_lock:
+            if self._seen_seq is None or seq > self._seen_seq:
+                self._external_change = True
+            self._seen_seq = seq + 1
+
+    def refresh(self):
+        # A reader may still see the value from before one of our own
+        # commits, so only a counter ahead of ours means an outside write
+        seq = self._conn().execute("SELECT value FROM meta WHERE key = 'change_seq'").fetchone()[0]
+        with self._seq_lock:
+            if self._seen_seq is not None and seq <= self._seen_seq and not self._external_change:
+                return
+            self._seen_seq = max(seq, self._seen_seq or 0)
+            self._external_change = False
+        self._notify_reset(self.outings)
+
+    def is_empty(self):
+        conn = self._conn()
+        return (conn.execute("SELECT COUNT(*) FROM outings").fetchone()[0] == 0
+                and conn.execute("SELECT COUNT(*) FROM students").fetchone()[0] == 0)
+
+    def import_rows(self, outing_rows, student_rows):
+        """Bulk-load sheet-shaped rows, e.g. to seed the database from Sheets."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for row in outing_rows:
+                self._insert(conn, row)
+            conn.executemany(
+                "INSERT OR REPLACE INTO students (StudentId, row) VALUES (?, ?)",
+                [(row[0], json.dumps(row)) for row in student_rows if row])
+            self._bump_change_seq(conn)
+            with self._seq_lock:
+                self._external_change = True
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _insert(self, conn, row):
+        row = ["" if value is None else str(value) for value in row[:len(OUTING_COLUMNS)]]
+        padded = row + [""] * (len(OUTING_COLUMNS) - len(row))
+        cursor = conn.execute(
+            f"INSERT INTO outings ({', '.join(OUTING_COLUMNS)}, width) "
+            f"VALUES ({', '.join('?' * len(OUTING_COLUMNS))}, ?)",
+            padded + [len(row)])
+        return cursor.lastrowid
+
+    def get_student(self, student_id):
+        record = self._conn().execute(
+            "SELECT row FROM students WHERE StudentId = ?", (student_id,)).fetchone()
+        return json.loads(record[0]) if record else None
+
+    def outings(self):
+        return [(record[0], self._row(record))
+                for record in self._conn().execute(self._SELECT + " ORDER BY id")]
+
+    def student_outings(self, student_id):
+        return [(record[0], self._row(record)) for record in self._conn().execute(
+            self._SELECT + " WHERE StudentId = ? ORDER BY id", (str(student_id).strip(),))]
+
+    def find_outing(self, student_id, out_date):
+        record = self._conn().execute(
+            self._SELECT + " WHERE StudentId = ? AND OutDate = ? ORDER BY id LIMIT 1",
+            (str(student_id).strip(), out_date)).fetchone()
+        return (record[0], self._row(record)) if record else (None, None)
+
+    def get_outing(self, row_id):
+        record = self._conn().execute(self._SELECT + " WHERE id = ?", (row_id,)).fetchone()
+        return (self._row(record), record[2]) if record else (None, None)
+
+    def add_outing(self, row):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row_id = self._insert(conn, row)
+            self._bump_change_seq(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._notify_rows([row_id])
+        return row_id
+
+    def update_outings(self, changes, value_input_option="RAW"):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for row_id, updates, expected_version in changes:
+                assignments = ", ".join(f"{OUTING_COLUMNS[column]} = ?" for column in updates)
+                params = ["" if value is None else str(value) for value in updates.values()]
+                sql = (f"UPDATE outings SET {assignments}, width = MAX(width, ?), "
+                       f"version = version + 1 WHERE id = ?")
+                params += [max(updates) + 1, row_id]
+                if expected_version is not None:
+                    sql += " AND version = ?"
+                    params.append(expected_version)
+                if conn.execute(sql, params).rowcount != 1:
+                    raise StaleRowError(row_id)
+            self._bump_change_seq(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._notify_rows(sorted({change[0] for change in changes}))
+
+    def remove_outings(self, rows):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = 0
+            for row_id, expected_version in rows:
+                sql, params = "DELETE FROM outings WHERE id = ?", [row_id]
+                if expected_version is not None:
+                    sql += " AND version = ?"
+                    params.append(expected_version)
+                removed += conn.execute(sql, params).rowcount
+            self._bump_change_seq(conn)
+            # Listeners only hear about rows that still exist, so have the
+            # next refresh rebuild them
+            with self._seq_lock:
+                self._external_change = True
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+
+class MirroredStorage(Storage):
+    """Serve everything from ``primary`` and replay writes onto ``mirror``.
+
+    Mirror writes run in order on one background thread and locate rows by
+    (StudentId, OutDate), since row ids differ between backends. A failed
+    mirror write is logged and skipped; the primary stays authoritative.
+    Like requests, mirror writes hold ``layout_lock`` shared, and mirrored
+    removals hold it exclusively.
+    """
+
+    def __init__(self, primary, mirror, layout_lock=None):
+        super().__init__()
+        self.primary = primary
+        self.mirror = mirror
+        self.layout_lock = layout_lock
+        self._pending = queue.Queue()
+        threading.Thread(target=self._replay, name="storage-mirror", daemon=True).start()
+
+    def _replay(self):
+        while True:
+            action, args = self._pending.get()
+            lock = self.layout_lock
+            try:
+                if lock is None:
+                    self._apply(action, args)
+                elif action == "remove":
+                    lock.acquire_exclusive()
+                    removed = 0
+                    try:
+                        removed = self._apply(action, args)
+                    finally:
+                        lock.release_exclusive(renumbered=bool(removed))
+                else:
+                    lock.acquire_shared()
+                    try:
+                        self._apply(action, args)
+                    finally:
+                        lock.release_shared()
+            except Exception:
+                log.exception("mirror write failed")
+
+    def _apply(self, action, args):
+        if action == "add":
+            self.mirror.add_outing(*args)
+        elif action == "remove":
+            found = [self.mirror.find_outing(*key)[0] for key in args]
+            return self.mirror.remove_outings([(row_id, None) for row_id in found if row_id is not None])
+        else:
+            keyed_changes, value_input_option = args
+            changes = []
+            for (student_id, out_date), updates in keyed_changes:
+                row_id, _ = self.mirror.find_outing(student_id, out_date)
+                if row_id is None:
+                    log.warning("mirror has no outing for %s on %s; skipping", student_id, out_date)
+                else:
+                    changes.append((row_id, updates, None))
+            if changes:
+                self.mirror.update_outings(changes, value_input_option)
+
+    def add_listener(self, listener):
+        self.primary.add_listener(listener)
+
+    def start(self):
+        self.primary.start()
+
+    def refresh(self):
+        self.primary.refresh()
+
+    def renumbered(self):
+        self.primary.renumbered()
+        self.mirror.renumbered()
+
+    def get_student(self, student_id):
+        return self.primary.get_student(student_id)
+
+    def outings(self):
+        return self.primary.outings()
+
+    def student_outings(self, student_id):
+        return self.primary.student_outings(student_id)
+
+    def find_outing(self, student_id, out_date):
+        return self.primary.find_outing(student_id, out_date)
+
+    def get_outing(self, row_id):
+        return self.primary.get_outing(row_id)
+
+    def add_outing(self, row):
+        row_id = self.primary.add_outing(row)
+        self._pending.put(("add", (row,)))
+        return row_id
+
+    def remove_outings(self, rows):
+        keys = {}
+        for row_id, _ in rows:
+            row, _ = self.primary.get_outing(row_id)
+            if row is not None:
+                keys[row_id] = (row[0], row[COLUMN["OutDate"]] if len(row) > COLUMN["OutDate"] else "")
+        removed = self.primary.remove_outings(rows)
+        gone = [key for row_id, key in keys.items() if self.primary.get_outing(row_id)[0] is None]
+        if gone:
+            self._pending.put(("remove", gone))
+        return removed
+
+    def update_outings(self, changes, value_input_option="RAW"):
+        self.primary.update_outings(changes, value_input_option)
+        # Replayed as one write too, keyed by (StudentId, OutDate)
+        keyed_changes = []
+        for row_id, updates, _ in changes:
+            row, _ = self.primary.get_outing(row_id)
+            key = (row[0], row[COLUMN["OutDate"]] if len(row) > COLUMN["OutDate"] else "")
+            keyed_changes.append((key, updates))
+        self._pending.put(("update", (keyed_changes, value_input_option)))
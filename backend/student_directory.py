@@ -0,0 +1,148 @@
+import collections
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class BoundedLRU:
+    """Dict-like cache holding at most ``maxsize`` entries, least recently used evicted first.
+
+    ``hits`` and ``misses`` count ``get`` calls that found an entry and
+    ones that did not.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class StudentDirectory:
+    """Every student-sheet row in memory, indexed by StudentId.
+
+    The first lookup (or ``start``) reads the whole sheet with
+    ``fetch_all()``. Refreshes then read only the StudentId column with
+    ``fetch_ids()`` and download full rows, via ``fetch_rows(positions)``,
+    just for positions whose id changed. Every ``full_reload_every``-th
+    refresh downloads everything again to pick up edits to other columns.
+
+    ``start`` refreshes in the background every ``interval`` seconds. A
+    lookup that misses also refreshes, at most every
+    ``miss_refresh_interval`` seconds, so a student added to the sheet
+    can be found right away.
+    """
+
+    def __init__(self, fetch_all, fetch_ids, fetch_rows, interval=300.0, full_reload_every=12,
+                 miss_refresh_interval=5.0, max_changed_share=0.25):
+        self._fetch_all = fetch_all
+        self._fetch_ids = fetch_ids
+        self._fetch_rows = fetch_rows
+        self.interval = interval
+        self.full_reload_every = full_reload_every
+        self.miss_refresh_interval = miss_refresh_interval
+        self.max_changed_share = max_changed_share
+        self._refresh_lock = threading.Lock()
+        self._rows = None
+        self._index = {}
+        self._refreshes = 0
+        self._last_refresh = 0.0
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def start(self):
+        """Keep the directory refreshed in the background and load it now.
+
+        The background refresher keeps running if the load raises, and
+        calling ``start`` again retries the load.
+        """
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="student-directory", daemon=True)
+            self._thread.start()
+        self.refresh(max_age=float("inf"))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("student directory refresh failed")
+
+    def get(self, student_id):
+        """Return the student-sheet row for ``student_id``, or None."""
+        if self._rows is None:
+            self.refresh(max_age=float("inf"))
+        row = self._index.get(student_id)
+        if row is None and time.monotonic() - self._last_refresh > self.miss_refresh_interval:
+            self.refresh(max_age=self.miss_refresh_interval)
+            row = self._index.get(student_id)
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    def refresh(self, max_age=None):
+        """Bring the directory up to date, unless it loaded under ``max_age`` seconds ago."""
+        with self._refresh_lock:
+            previous = self._rows
+            if max_age is not None and previous is not None and time.monotonic() - self._last_refresh <= max_age:
+                return  # Another caller refreshed while this one waited
+            self._refreshes += 1
+            if previous is None or self.full_reload_every <= 1 or self._refreshes % self.full_reload_every == 0:
+                rows = self._load_all()
+            else:
+                rows = self._load_changes(previous)
+            if rows is not previous:
+                index = {}
+                for row in rows:
+                    if row:
+                        index.setdefault(row[0], row)  # First match wins, as a top-down scan would
+                self._rows, self._index = rows, index
+            self._last_refresh = time.monotonic()
+
+    def _load_all(self):
+        self.reloads += 1
+        return self._fetch_all()
+
+    def _load_changes(self, previous):
+        ids = self._fetch_ids()
+        changed = [idx for idx, student_id in enumerate(ids)
+                   if idx >= len(previous) or (previous[idx][0] if previous[idx] else "") != student_id]
+        if not changed and len(ids) == len(previous):
+            return previous
+        if len(changed) > max(1, len(ids) * self.max_changed_share):
+            return self._load_all()
+        rows = list(previous[:len(ids)]) + [[] for _ in range(len(ids) - len(previous))]
+        for idx, row in self._fetch_rows(changed).items():
+            rows[idx] = row
+        log.info("student directory updated", extra={"changed": len(changed), "students": len(ids)})
+        return rows
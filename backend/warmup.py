@@ -0,0 +1,56 @@
+import logging
+import threading
+import time
+
+from workers import OncePerProcess, start_daemon
+
+log = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """Runs start-up work in a background thread and reports readiness.
+
+    ``steps`` is ``[(name, fn), ...]``, run in order. A step that raises is
+    logged and retried every ``retry_interval`` seconds, so a worker started
+    while Google is unreachable still comes up and warms once it can.
+
+    ``start`` is safe to call on every request: it starts the thread once
+    per process, including in workers forked after the module was imported.
+    """
+
+    def __init__(self, steps, retry_interval=5.0):
+        self.steps = steps
+        self.retry_interval = retry_interval
+        self._start = OncePerProcess(start_daemon, self._run, "warm-up")
+        self._done = {name: False for name, _ in steps}
+        self._errors = {}
+        self._finished = threading.Event()
+
+    def start(self):
+        self._start()
+
+    def _run(self):
+        started = time.monotonic()
+        for name, step in self.steps:
+            while True:
+                try:
+                    step()
+                    break
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    log.warning("warm-up step failed; retrying", extra={"step": name, "error": str(e)})
+                    time.sleep(self.retry_interval)
+            self._errors.pop(name, None)
+            self._done[name] = True
+        self._finished.set()
+        log.info("warm-up finished", extra={"seconds": round(time.monotonic() - started, 3)})
+
+    def wait(self, timeout=None):
+        """Block until every step has run; False if ``timeout`` passed first."""
+        return self._finished.wait(timeout)
+
+    def status(self):
+        """Return ``(ready, {step: "ok" | "pending" | error message})``."""
+        checks = {name: "ok" if self._done[name] else self._errors.get(name, "pending")
+                  for name, _ in self.steps}
+        return self._finished.is_set(), checks
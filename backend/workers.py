@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+
+
+def start_daemon(target, name):
+    """Start ``target`` on a daemon thread called ``name``."""
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+class OncePerProcess:
+    """Calls ``fn(*args)`` the first time it is called in each process.
+
+    Background threads do not survive a fork, so a component built at
+    import time (gunicorn ``--preload``) starts its threads from a hook
+    that runs on every request; this makes that hook start them once in
+    the parent and once more in each forked worker.
+    """
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def __call__(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.fn(*self.args)
+
+
+def create_lease_table(conn, table):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            owner TEXT NOT NULL,
+            expires REAL NOT NULL
+        )""")
+
+
+def hold_lease(conn, table, owner, seconds):
+    """True if ``owner`` holds the lease in ``table``; takes or renews it for ``seconds``.
+
+    Worker processes sharing one SQLite file elect a single one to run a
+    background job this way: the lease is free when nobody holds it or the
+    holder let it lapse. ``conn`` must be in autocommit mode
+    (``isolation_level=None``).
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        lease = conn.execute(f"SELECT owner, expires FROM {table} WHERE id = 1").fetchone()
+        held = lease is None or lease[0] == owner or lease[1] < now
+        if held:
+            conn.execute(f"INSERT OR REPLACE INTO {table} (id, owner, expires) VALUES (1, ?, ?)",
+                         (owner, now + seconds))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return held